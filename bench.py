@@ -0,0 +1,733 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from argparse import SUPPRESS, ArgumentParser
+from collections import Counter
+from collections.abc import Callable
+from email.utils import formatdate
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import perf_counter, time
+from types import ModuleType
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+OWNER = "bench-bot"
+MASTER_SHA = "1" * 40
+LAST_MODIFIED = formatdate(1_760_000_000, usegmt=True)
+_BLOCK = bytes(range(256)) * 4096  # 1 MiB
+
+
+def _asset(owner_and_repo: str, tag: str, name: str, size: int, *, digest: bool) -> dict:
+    asset = {
+        "name": name,
+        "label": "",
+        "browser_download_url": f"https://github.com/{owner_and_repo}/releases/download/{tag}/{name}",
+    }
+    if digest:
+        asset["digest"] = "sha256:" + _synthetic_sha256(size)
+    return asset
+
+
+def _synthetic_sha256(size: int) -> str:
+    h = sha256()
+    for _ in range(size // len(_BLOCK)):
+        h.update(_BLOCK)
+    h.update(_BLOCK[: size % len(_BLOCK)])
+    return h.hexdigest()
+
+
+def _release(owner_and_repo: str, version: str, assets: list[str], size: int, *, digest=True):
+    tag = f"v{version}"
+    return {
+        "tag_name": tag,
+        "draft": False,
+        "prerelease": False,
+        "html_url": f"https://github.com/{owner_and_repo}/releases/tag/{tag}",
+        "published_at": "2025-10-09T08:00:00Z",
+        "body": f"## Release Notes\n\n### Changes\n\n- Bump to {version} in "
+        f"https://github.com/{owner_and_repo}/pull/1 by @bench\n" * 20,
+        "assets": [_asset(owner_and_repo, tag, name, size, digest=digest) for name in assets],
+    }
+
+
+def _manifests(identifier: str, version: str, archs: list[str], locales: list[str]) -> dict:
+    header = (
+        "# yaml-language-server: $schema=https://aka.ms/winget-manifest.{}.1.10.0.schema.json\n\n"
+    )
+    installers = "".join(
+        f"- Architecture: {arch}\n"
+        f"  InstallerUrl: https://example.invalid/{identifier}/{version}/{arch}.zip\n"
+        f"  InstallerSha256: {'0' * 64}\n"
+        for arch in archs
+    )
+    manifests = {
+        f"{identifier}.yaml": header.format("version")
+        + f"PackageIdentifier: {identifier}\nPackageVersion: {version}\nDefaultLocale: {locales[0]}\n"
+        "ManifestType: version\nManifestVersion: 1.10.0\n",
+        f"{identifier}.installer.yaml": header.format("installer")
+        + f"PackageIdentifier: {identifier}\nPackageVersion: {version}\nInstallerType: zip\n"
+        f"Installers:\n{installers}ManifestType: installer\nManifestVersion: 1.10.0\n",
+    }
+    for i, locale in enumerate(locales):
+        kind = "defaultLocale" if i == 0 else "locale"
+        manifests[f"{identifier}.locale.{locale}.yaml"] = header.format(kind) + (
+            f"PackageIdentifier: {identifier}\nPackageVersion: {version}\nPackageLocale: {locale}\n"
+            f"Publisher: Bench\nPackageName: {identifier}\nLicense: MIT\n"
+            f"ShortDescription: {identifier}\nManifestType: {kind}\nManifestVersion: 1.10.0\n"
+        )
+    return manifests
+
+
+class World:
+    def __init__(self, installer_size: int) -> None:
+        self.installer_size = installer_size
+        self.releases: dict[str, list[dict]] = {}
+        self.winget: dict[str, dict[str, dict[str, str]]] = {}
+        self.state: dict[str, str] = {}
+        self.packages: list[ModuleType] = []
+        self.telegram_version = (7, 0, 9)
+        self.telegram_assets = True
+        self.wetype_version = "2.1.2.3"
+        self.discord = (9178, 9059)
+
+    def add_winget(self, identifier: str, version: str, archs: list[str], locales=("en-US",)):
+        manifests = _manifests(identifier, version, archs, list(locales))
+        self.winget.setdefault(identifier, {})[version] = manifests
+
+    def add_release(self, owner_and_repo: str, release: dict):
+        self.releases.setdefault(owner_and_repo, []).insert(0, release)
+
+
+def _default_world(installer_size: int, *, ruff_version="0.16.2") -> World:
+    import main
+
+    world = World(installer_size)
+    world.packages = [*main.PACKAGES, __import__("discord")]
+    world.state.update({
+        "ruff.txt": "0.16.2",
+        "scc.txt": "3.7.0",
+        "oxipng.txt": "10.1.1",
+        "notepad4.txt": "26.07r6234",
+        "discord.txt": "9178,9059",
+        "telegram.json": '{"version":"7.0.9","has_release_notes":true,"blocking_pr":null,'
+        '"memo":{"is_arm_updated":true,"is_github_release":true}}',
+        "wetype.json": '{"version":"2.1.2.3","has_release_notes":false,"blocking_pr":null,'
+        '"memo":"bench-etag"}',
+    })
+    ruff_assets = [
+        "ruff-i686-pc-windows-msvc.zip",
+        "ruff-x86_64-pc-windows-msvc.zip",
+        "ruff-aarch64-pc-windows-msvc.zip",
+    ]
+    world.add_release(
+        "astral-sh/ruff", _release("astral-sh/ruff", "0.16.2", ruff_assets, installer_size)
+    )
+    if ruff_version != "0.16.2":
+        release = _release("astral-sh/ruff", ruff_version, ruff_assets, installer_size)
+        world.add_release("astral-sh/ruff", release)
+    world.add_winget("astral-sh.ruff", "0.16.2", ["x86", "x64", "arm64"])
+    world.add_release("boyter/scc", _release("boyter/scc", "3.7.0", [], installer_size))
+    world.add_release(
+        "shssoichiro/oxipng", _release("shssoichiro/oxipng", "10.1.1", [], installer_size)
+    )
+    world.add_release(
+        "zufuliu/notepad4", _release("zufuliu/notepad4", "26.07r6234", [], installer_size)
+    )
+    world.add_winget("Telegram.TelegramDesktop", "7.0.9", ["x64", "x86", "arm64"])
+    world.add_winget("Tencent.WeType", "2.1.2.3", ["x64", "arm64"], ["zh-CN"])
+    world.add_winget("Discord.Discord", "1.0.9178", ["x64"])
+    world.add_winget("Discord.Discord", "1.0.9059", ["x86"])
+    return world
+
+
+def _telegram_release(world: World, version: str) -> dict:
+    names = [
+        f"tsetup-x64.{version}.exe",
+        f"tsetup.{version}.exe",
+        f"tsetup-arm64.{version}.exe",
+        f"tportable-x64.{version}.zip",
+        f"tportable.{version}.zip",
+        f"tportable-arm64.{version}.zip",
+    ]
+    release = _release("telegramdesktop/tdesktop", version, names, world.installer_size)
+    if not world.telegram_assets:
+        release["assets"] = []
+    return release
+
+
+def _scenario_nothing_changed(installer_size: int) -> World:
+    world = _default_world(installer_size)
+    world.add_release("telegramdesktop/tdesktop", _telegram_release(world, "7.0.9"))
+    return world
+
+
+def _scenario_one_new_release(installer_size: int) -> World:
+    world = _default_world(installer_size, ruff_version="0.16.3")
+    world.add_release("telegramdesktop/tdesktop", _telegram_release(world, "7.0.9"))
+    return world
+
+
+def _scenario_vendor_update(installer_size: int) -> World:
+    world = _default_world(installer_size)
+    world.telegram_version = (7, 0, 10)
+    world.telegram_assets = False
+    world.add_release("telegramdesktop/tdesktop", _telegram_release(world, "7.0.9"))
+    world.add_release("telegramdesktop/tdesktop", _telegram_release(world, "7.0.10"))
+    return world
+
+
+def _scenario_quiet_hour(installer_size: int) -> World:
+    # nothing changed and the previous scheduled run checked the release notes and the memo
+    from with_release_notes import RUN_INTERVAL
+
+    world = _scenario_nothing_changed(installer_size)
+    checked = dict.fromkeys(("has_release_notes", "get_memo"), time() - RUN_INTERVAL)
+    world.state[".cache/wetype.json"] = json.dumps({"version": "2.1.2.3", "checked": checked})
+    return world
+
+
+def _scenario_waiting_for_notes(installer_size: int) -> World:
+    # the run after only the memo was checked: the change log is due and was downloaded before
+    from with_release_notes import RUN_INTERVAL
+
+    world = _scenario_nothing_changed(installer_size)
+    checked = {"get_memo": time() - RUN_INTERVAL}
+    world.state[".cache/wetype.json"] = json.dumps({"version": "2.1.2.3", "checked": checked})
+    world.state[".cache/wetype-change-log.json"] = json.dumps({
+        "version": "2.1.2",
+        "headers": {"If-None-Match": '"bench-change-log"'},
+        "release": None,
+    })
+    return world
+
+
+def _scenario_discord_both_archs(installer_size: int) -> World:
+    world = _scenario_nothing_changed(installer_size)
+    world.discord = (9180, 9180)
+    return world
+
+
+def _scenario_discord_after_merge(installer_size: int) -> World:
+    # the version a merged update wrote is the base of the next single-architecture update
+    from manifest_yaml import transform
+
+    world = _scenario_nothing_changed(installer_size)
+    changes = {
+        "version": "1.0.9180",
+        "installers": [
+            {"Architecture": arch, "InstallerUrl": f"{arch}.exe", "InstallerSha256": "1" * 64}
+            for arch in ("x64", "x86")
+        ],
+        "override_old_installers": False,
+        "merge_installers_by_architecture": True,
+        "release_date": None,
+        "keep_notes_on_version_prefix": None,
+        "locales": [],
+    }
+    world.winget["Discord.Discord"]["1.0.9180"] = {
+        filename: transform(filename, text, changes)
+        for filename, text in world.winget["Discord.Discord"]["1.0.9178"].items()
+    }
+    world.state["discord.txt"] = "9180,9180"
+    world.discord = (9181, 9180)
+    return world
+
+
+def _scenario_catch_up(installer_size: int) -> World:
+    # a fast-moving project published four releases since the last run
+    import github_releases
+
+    world = _scenario_nothing_changed(installer_size)
+    owner_and_repo = "bench/fast"
+    world.state["fast.txt"] = "1.0.0"
+    world.add_release(owner_and_repo, _release(owner_and_repo, "1.0.0", [], installer_size))
+    for minor in range(1, 5):
+        assets = [f"fast-1.{minor}.0-{arch}.zip" for arch in ("x64", "arm64")]
+        release = _release(owner_and_repo, f"1.{minor}.0", assets, installer_size, digest=False)
+        world.add_release(owner_and_repo, release)
+    world.add_winget("Bench.Fast", "1.0.0", ["x64", "arm64"])
+
+    module = ModuleType("fast")
+    module.main = lambda: github_releases.main(
+        identifier="Bench.Fast",
+        installers=[
+            {"Architecture": arch, "InstallerUrl": f"fast-{{version}}-{arch}.zip"}
+            for arch in ("x64", "arm64")
+        ],
+        locale="en-US",
+        moniker="fast",
+        owner_and_repo=owner_and_repo,
+        catch_up=True,
+    )
+    world.packages.append(module)
+    return world
+
+
+def _scenario_50_packages_changed(installer_size: int) -> World:
+    import github_releases
+
+    world = _scenario_nothing_changed(installer_size)
+    for i in range(50):
+        owner_and_repo = f"bench/package{i}"
+        identifier = f"Bench.Package{i}"
+        world.state[f"bench{i}.txt"] = "1.0.0"
+        world.add_release(owner_and_repo, _release(owner_and_repo, "1.0.0", [], installer_size))
+        assets = [f"package{i}-1.1.0-x64.zip"]
+        release = _release(owner_and_repo, "1.1.0", assets, installer_size, digest=False)
+        world.add_release(owner_and_repo, release)
+        world.add_winget(identifier, "1.0.0", ["x64"])
+
+        module = ModuleType(f"bench{i}")
+        module.main = lambda i=i, owner_and_repo=owner_and_repo, identifier=identifier: (
+            github_releases.main(
+                identifier=identifier,
+                installers=[
+                    {"Architecture": "x64", "InstallerUrl": f"package{i}-{{version}}-x64.zip"}
+                ],
+                locale="en-US",
+                moniker=f"bench{i}",
+                owner_and_repo=owner_and_repo,
+            )
+        )
+        world.packages.append(module)
+    return world
+
+
+SCENARIOS: dict[str, Callable[[int], World]] = {
+    "nothing-changed": _scenario_nothing_changed,
+    "quiet-hour": _scenario_quiet_hour,
+    "waiting-for-notes": _scenario_waiting_for_notes,
+    "one-new-release": _scenario_one_new_release,
+    "vendor-update": _scenario_vendor_update,
+    "discord-both-archs": _scenario_discord_both_archs,
+    "discord-after-merge": _scenario_discord_after_merge,
+    "catch-up": _scenario_catch_up,
+    "50-packages-changed": _scenario_50_packages_changed,
+}
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, world: World) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.world = world
+        self.requests: Counter[str] = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.pulls = 0
+
+    def handle_error(self, request, client_address):
+        # streaming clients close the connection once they have what they need
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+_ROUTES: list[tuple[str, str, re.Pattern, str, Callable]] = []
+
+
+def _route(method: str, host: str, path: str):
+    pattern = re.compile(re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", path) + "$")
+
+    def decorator(fn):
+        _ROUTES.append((method, host, pattern, path, fn))
+        return fn
+
+    return decorator
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        host = self.headers["Host"].partition(":")[0]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self.server.bytes_in += length + len(self.requestline) + len(str(self.headers))
+        path = self.path.partition("?")[0]
+        method = "GET" if self.command == "HEAD" else self.command
+        for route_method, route_host, pattern, template, fn in _ROUTES:
+            if route_method == method and route_host == host and (match := pattern.match(path)):
+                name = f"{self.command} {host}{template}"
+                if template == "/graphql":
+                    name += (
+                        " " + re.search(r"(?:query|mutation) (\w+)", json.loads(body)["query"])[1]
+                    )
+                self.server.requests[name] += 1
+                return fn(self, body=body, **match.groupdict())
+        self.server.requests[f"{self.command} {host} (unknown)"] += 1
+        self._json({"message": "Not Found"}, 404)
+
+    do_GET = do_HEAD = do_POST = do_PATCH = do_PUT = do_DELETE = _handle
+
+    def _send(self, status: int, headers: dict[str, str], body: bytes = b""):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+            self.server.bytes_out += len(body)
+
+    def _json(self, payload, status: int = 200):
+        if payload is None:
+            return self._send(204, {})
+        self._send(status, {"Content-Type": "application/json"}, json.dumps(payload).encode())
+
+    def _text(self, text: str, headers: dict[str, str] | None = None):
+        self._send(200, {"Content-Type": "text/html", **(headers or {})}, text.encode())
+
+    def _installer(self):
+        size = self.server.world.installer_size
+        self.send_response(200)
+        self.send_header("Content-Length", str(size))
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("ETag", '"bench-etag"')
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        while size > 0:
+            self.wfile.write(chunk := _BLOCK[: min(size, len(_BLOCK))])
+            size -= len(chunk)
+            self.server.bytes_out += len(chunk)
+
+
+@_route("GET", "api.github.com", "/repos/{owner}/{repo}/releases/latest")
+def _latest_release(self: _Handler, *, owner, repo, **_):
+    releases = self.server.world.releases.get(f"{owner}/{repo}")
+    self._json(releases[0] if releases else {"message": "Not Found"}, 200 if releases else 404)
+
+
+@_route("GET", "api.github.com", "/repos/{owner}/{repo}/releases/tags/{tag}")
+def _release_by_tag(self: _Handler, *, owner, repo, tag, **_):
+    releases = self.server.world.releases.get(f"{owner}/{repo}", [])
+    if release := next((r for r in releases if r["tag_name"] == tag), None):
+        return self._json(release)
+    self._json({"message": "Not Found"}, 404)
+
+
+@_route("GET", "api.github.com", "/repos/{owner}/{repo}/releases")
+def _releases(self: _Handler, *, owner, repo, **_):
+    query = parse_qs(urlsplit(self.path).query)
+    per_page, page = int(query.get("per_page", ["30"])[0]), int(query.get("page", ["1"])[0])
+    releases = self.server.world.releases.get(f"{owner}/{repo}", [])
+    headers = {"Content-Type": "application/json"}
+    if len(releases) > page * per_page:
+        url = f"https://api.github.com/repos/{owner}/{repo}/releases"
+        headers["Link"] = f'<{url}?per_page={per_page}&page={page + 1}>; rel="next"'
+    body = json.dumps(releases[(page - 1) * per_page : page * per_page]).encode()
+    self._send(200, headers, body)
+
+
+@_route("GET", "api.github.com", "/repos/microsoft/winget-pkgs/git/matching-refs/heads/master")
+def _matching_refs(self: _Handler, **_):
+    self._json([{"ref": "refs/heads/master", "object": {"sha": MASTER_SHA}}])
+
+
+@_route("GET", "api.github.com", "/repos/microsoft/winget-pkgs/issues/{number}")
+def _issue(self: _Handler, **_):
+    self._json({"state": "open"})
+
+
+@_route("POST", "api.github.com", "/repos/microsoft/winget-pkgs/forks")
+def _fork(self: _Handler, **_):
+    self._json({"node_id": "R_bench"}, 202)
+
+
+@_route("PATCH", "api.github.com", "/repos/{owner}/winget-pkgs")
+def _patch_repo(self: _Handler, **_):
+    self._json({})
+
+
+@_route("DELETE", "api.github.com", "/repos/{owner}/winget-pkgs")
+def _delete_repo(self: _Handler, **_):
+    self._json(None)
+
+
+@_route("PUT", "api.github.com", "/repos/{owner}/winget-pkgs/actions/permissions")
+def _permissions(self: _Handler, **_):
+    self._json(None)
+
+
+@_route("GET", "api.github.com", "/repos/{owner}/winget-pkgs/branches/master")
+def _branch(self: _Handler, **_):
+    self._json({"name": "master"})
+
+
+@_route("POST", "api.github.com", "/repos/{owner}/winget-pkgs/git/refs")
+def _create_ref(self: _Handler, *, body: bytes, **_):
+    self._json({"ref": json.loads(body)["ref"]}, 201)
+
+
+@_route("POST", "api.github.com", "/repos/{owner}/winget-pkgs/merge-upstream")
+def _merge_upstream(self: _Handler, **_):
+    self._json({"merge_type": "none"})
+
+
+@_route("POST", "api.github.com", "/repos/microsoft/winget-pkgs/pulls")
+def _create_pull(self: _Handler, **_):
+    self.server.pulls += 1
+    self._json(
+        {"html_url": f"https://github.com/microsoft/winget-pkgs/pull/{self.server.pulls}"}, 201
+    )
+
+
+@_route("POST", "api.github.com", "/graphql")
+def _graphql(self: _Handler, *, body: bytes, **_):
+    request = json.loads(body)
+    operation = re.search(r"(?:query|mutation) (\w+)", request["query"])[1]
+    variables = request["variables"]
+    match operation:
+        case "GetBranches":
+            ref = {"name": "master", "associatedPullRequests": {"nodes": []}}
+            repository = {
+                "id": "R_bench",
+                "isEmpty": False,
+                "defaultBranchRef": {"name": "master"},
+                "refs": {"nodes": [ref]},
+            }
+            data = {"repository": repository}
+        case "PullRequestSearch":
+            data = {"search": {"nodes": []}}
+        case "GetDirectoryContentWithText":
+            data = {"repository": {"object": _get_tree(self.server.world, variables["expression"])}}
+        case "CreateCommit":
+            branch = variables["input"]["branch"]["branchName"]
+            url = f"https://github.com/{OWNER}/winget-pkgs/commit/{sha256(branch.encode()).hexdigest()}"
+            data = {"createCommitOnBranch": {"commit": {"url": url}}}
+        case _:
+            data = {}
+    self._json({"data": data})
+
+
+def _get_tree(world: World, expression: str) -> dict | None:
+    _, _, path = expression.partition(":")
+    parts = path.split("/")[2:]
+    for identifier, versions in world.winget.items():
+        if identifier.split(".") == parts:
+            return {"entries": [{"name": version, "object": {}} for version in versions]}
+        if identifier.split(".") == parts[:-1] and (manifests := versions.get(parts[-1])):
+            return {
+                "entries": [
+                    {"name": name, "object": {"text": text}} for name, text in manifests.items()
+                ]
+            }
+    return None
+
+
+@_route("GET", "github.com", "/{owner}/{repo}/releases/download/{tag}/{name}")
+def _release_asset(self: _Handler, **_):
+    self._installer()
+
+
+@_route("GET", "td.telegram.org", "/current4")
+def _telegram_current(self: _Handler, **_):
+    major, minor, patch = self.server.world.telegram_version
+    code = str((major * 1000 + minor) * 1000 + patch)
+    channel = {"stable": {"released": code}}
+    self._json({"win64": channel, "win": channel, "winarm": {"stable": code}})
+
+
+@_route("GET", "td.telegram.org", "/{directory}/{name}")
+def _telegram_installer(self: _Handler, **_):
+    self._installer()
+
+
+@_route("GET", "z.weixin.qq.com", "/web/api/app_info")
+def _wetype_app_info(self: _Handler, **_):
+    url = f"https://download.z.weixin.qq.com/app/WeTypeSetup_{self.server.world.wetype_version}.exe"
+    self._json({"data": {"windows": {"latest": url}}})
+
+
+@_route("GET", "z.weixin.qq.com", "/web/change-log/")
+def _wetype_change_log(self: _Handler, **_):
+    if self.headers.get("If-None-Match") == '"bench-change-log"':
+        return self._send(304, {"ETag": '"bench-change-log"'})
+    changelog = [
+        {
+            "id": i,
+            "platform": i % 5,
+            "version": f"1.{i}",
+            "release_date": 1_700_000_000 + i * 86400,
+            "content_html": "<p>" + "更新" * 200 + "</p>",
+        }
+        for i in range(200)
+    ]
+    data = json.dumps({"appChangelog": changelog}, ensure_ascii=False)
+    self._text(
+        f"<html><script>window.injectData={data}</script></html>" + " " * 200_000,
+        {"ETag": '"bench-change-log"'},
+    )
+
+
+@_route("GET", "download.z.weixin.qq.com", "/app/{name}")
+def _wetype_installer(self: _Handler, **_):
+    self._installer()
+
+
+@_route("GET", "updates.discord.com", "/distributions/app/manifests/latest")
+def _discord_manifest(self: _Handler, **_):
+    arch = re.search(r"arch=(\w+)", self.path)[1]
+    self._json({"full": {"host_version": [1, 0, self.server.world.discord[arch == "x86"]]}})
+
+
+@_route("GET", "dl.discordapp.net", "/distro/app/stable/win/{arch}/{version}/{name}")
+def _discord_installer(self: _Handler, **_):
+    self._installer()
+
+
+def _redirect_to(port: int):
+    # modules bind common.CLIENT when they are imported, so this has to come first
+    assert "common" not in sys.modules
+    import httpx
+
+    import common
+
+    class Redirect(httpx.HTTPTransport):
+        def handle_request(self, request: httpx.Request) -> httpx.Response:
+            url = request.url.copy_with(scheme="http", host="127.0.0.1", port=port)
+            request = httpx.Request(
+                request.method,
+                url,
+                headers=request.headers,
+                stream=request.stream,
+                extensions=request.extensions,
+            )
+            return super().handle_request(request)
+
+    # every host class goes to the stand-in server over plain HTTP/1.1
+    common.CLIENT = common.make_client(Redirect())
+
+
+def _run_scenario(name: str, port: int, installer_size: int, output: str):
+    import resource
+
+    _redirect_to(port)
+    world = SCENARIOS[name](installer_size)
+    for filename, content in world.state.items():
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(filename, "w") as f:
+            f.write(content)
+
+    import main
+
+    started = perf_counter()
+    error = None
+    try:
+        main.run(world.packages)
+    except Exception as e:
+        error = repr(e)
+    elapsed = perf_counter() - started
+
+    import latency
+    import metrics
+    import profiling
+    import tracing
+
+    if os.getenv("REPORTS_DIR"):
+        metrics.write_report()
+        tracing.write_trace()
+        profiling.write_report()
+        latency.write_textfile()
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "wall_seconds": elapsed,
+                "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                "error": error,
+                "packages": metrics.get_report()["packages"],
+                "modules": sorted(sys.modules),
+            },
+            f,
+        )
+
+
+def bench(name: str, installer_size: int, verbose: bool, reports: str | None) -> dict:
+    server = FakeServer(SCENARIOS[name](installer_size))
+    Thread(target=server.serve_forever, daemon=True).start()
+    with tempfile.TemporaryDirectory() as cwd:
+        output = os.path.join(cwd, "result.json")
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                *("--child", name, str(server.server_port), output),
+                *("--installer-mb", str(installer_size / 2**20)),
+            ],
+            cwd=cwd,
+            env={**os.environ, "REPORTS_DIR": os.path.abspath(f"{reports}/{name}")}
+            if reports
+            else None,
+            check=True,
+            stdout=None if verbose else subprocess.DEVNULL,
+            stderr=None if verbose else subprocess.DEVNULL,
+        )
+        with open(output) as f:
+            result = json.load(f)
+    server.shutdown()
+    result.update({
+        "requests": sum(server.requests.values()),
+        "bytes_in": server.bytes_in,
+        "bytes_out": server.bytes_out,
+        "endpoints": dict(server.requests.most_common()),
+    })
+    return result
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark main.run against local stand-in servers")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=", ".join(SCENARIOS))
+    parser.add_argument(
+        "--installer-mb", type=float, default=8, help="size of synthetic installers"
+    )
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the runs")
+    parser.add_argument("--reports", help="keep each run's metrics and trace in this directory")
+    parser.add_argument("--child", nargs=3, help=SUPPRESS)
+    args = parser.parse_args()
+    installer_size = int(args.installer_mb * 2**20)
+
+    os.environ.update({
+        "GITHUB_TOKEN": "bench",
+        "GITHUB_REPOSITORY_OWNER": OWNER,
+        "FORK_POLICY": "keep",
+    })
+    sys.path.insert(0, ROOT)
+
+    if args.child:
+        name, port, output = args.child
+        return _run_scenario(name, int(port), installer_size, output)
+
+    if unknown := set(args.scenarios) - SCENARIOS.keys():
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        results[name] = result = bench(name, installer_size, args.verbose, args.reports)
+        print(
+            f"{name}: {result['wall_seconds']:.2f}s, {result['requests']} requests,"
+            f" {result['bytes_out'] / 2**20:.1f} MiB down, {result['bytes_in'] / 2**10:.1f} KiB up,"
+            f" peak RSS {result['peak_rss_mib']:.0f} MiB"
+            + (f", error: {result['error']}" if result["error"] else "")
+        )
+        for endpoint, count in result["endpoints"].items():
+            print(f"  {count:4} {endpoint}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if any(result["error"] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import os
+import re
+import sys
+from argparse import ArgumentParser
+from collections.abc import Callable
+from functools import partial
+from glob import glob
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from release_notes import Rules
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(ROOT, ".corpus", "release-notes")
+
+# moniker -> (owner_and_repo, locale)
+PACKAGES = {
+    "ruff": ("astral-sh/ruff", "en-US"),
+    "scc": ("boyter/scc", "en-US"),
+    "v2rayn": ("2dust/v2rayN", "zh-CN"),
+    "notepad4": ("zufuliu/notepad4", "en-US"),
+}
+
+
+# the regex chains release_notes.py replaced, kept to check that outputs stay the same
+
+
+def _old_ruff(release_notes: str) -> str:
+    release_notes = re.sub(r"^#+ Release Notes.*", "", release_notes)
+    release_notes = re.sub(r"#+ Contributors.+", "", release_notes, flags=re.DOTALL)
+    release_notes = re.sub(r"#+ Install ruff .+", "", release_notes, flags=re.DOTALL)
+    release_notes = re.sub(r"\\\[`(.+?)`\\\]", r"[\1]", release_notes)
+    release_notes = re.sub(r"`([A-Z]+\d+)`", r"\1", release_notes)
+    return release_notes
+
+
+def _old_scc(release_notes: str) -> str:
+    release_notes = re.sub(r"^#+ Release.*", "", release_notes)
+    release_notes = re.sub(r"#+ Changelog.+", "", release_notes, flags=re.DOTALL)
+    return release_notes
+
+
+def _old_v2rayn(release_notes: str) -> str:
+    release_notes = re.sub(r"^#+ 本次更新.*", "", release_notes)
+    release_notes = re.sub(r"#+ 注意.+", "", release_notes, flags=re.DOTALL)
+    release_notes = re.sub(r"#+ 发布文件介绍.*", "", release_notes, flags=re.DOTALL)
+    return release_notes
+
+
+def _old_notepad4(release_notes: str) -> str:
+    _, release_notes = re.split(r"#+ Changes Since .+", release_notes)
+    release_notes = re.sub(r"#+ File List.+", "", release_notes, flags=re.DOTALL)
+    release_notes = re.sub(r"[,:]? ?[0-9a-f]{40}(?: and|, etc\.?)?", "", release_notes)
+    release_notes = re.sub(r"(?<!\.)\.\.(?=\s|$)", ".", release_notes, flags=re.MULTILINE)
+    release_notes = release_notes.replace(" ()", "")
+    release_notes = re.sub(r"</?kbd>", "`", release_notes)
+    return release_notes
+
+
+def _old_normalize(notes: str, owner_and_repo: str | None, locale: str) -> str:
+    notes = notes.strip().replace("\r\n", "\n")
+    notes = re.sub(r"\[([^\]]+?)\]\(\S+?\)", r"\1", notes)
+    notes = re.sub(r"(^|\n)#+ (.+?)\n+", r"\1\2\n", notes)
+    notes = re.sub(r"(\*{2,})([^*`\n]+?)\1", r"\2", notes)
+    if owner_and_repo:
+        notes = re.sub(
+            rf"https://github\.com/{owner_and_repo}/(?:issues|pull|discussions)/(\d+)",
+            r"#\1",
+            notes,
+        )
+        notes = re.sub(
+            r"https://github\.com/([-\w]+)/([-\w]+)/(?:issues|pull|discussions)/(\d+)",
+            r"\1/\2#\3",
+            notes,
+        )
+        notes = re.sub(r"(?:https://github\.com/.+?/commit/)?[0-9a-z]{40}", "", notes)
+    if locale == "zh-CN":
+        from pangu import spacing
+
+        notes = spacing(notes)
+    notes = re.sub(r" +$", "", notes, flags=re.MULTILINE)
+    return notes
+
+
+_OLD_TRANSFORMS: dict[str, Callable[[str], str]] = {
+    "ruff": _old_ruff,
+    "scc": _old_scc,
+    "v2rayn": _old_v2rayn,
+    "notepad4": _old_notepad4,
+}
+
+
+def fetch(corpus: str, pages: int) -> None:
+    from common import CLIENT
+
+    headers = {}
+    if token := os.getenv("GITHUB_TOKEN"):
+        headers["Authorization"] = f"token {token}"
+    for moniker, (owner_and_repo, _) in PACKAGES.items():
+        os.makedirs(directory := os.path.join(corpus, moniker), exist_ok=True)
+        for page in range(1, pages + 1):
+            response = CLIENT.get(
+                f"https://api.github.com/repos/{owner_and_repo}/releases",
+                params={"per_page": 100, "page": page},
+                headers=headers,
+            ).raise_for_status()
+            for release in response.json():
+                if body := release["body"]:
+                    with open(os.path.join(directory, f"{release['id']}.md"), "w") as f:
+                        f.write(body)
+
+
+def _get_adversarial() -> dict[str, str]:
+    # inputs the old chain handled in quadratic time
+    return {
+        "unclosed brackets": "- [" + " [x" * 5_000 + "\n" + "text\n" * 2_000,
+        "github links without commits": "see " + " https://github.com/o/r/releases" * 2_000,
+        "lowercase runs": "a" * 39 + " " + ("b" * 39 + " ") * 5_000,
+        "unclosed bold": "**" * 10_000 + "\n" + "- **a `b`\n" * 2_000,
+    }
+
+
+def _read(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def _old(
+    transform: Callable[[str], str], notes: str, owner_and_repo: str | None, locale: str
+) -> str:
+    try:
+        transformed = transform(notes)
+    except ValueError as e:
+        return repr(e)
+    return _old_normalize(transformed, owner_and_repo, locale)
+
+
+def _new(rules: "Rules", notes: str, owner_and_repo: str | None, locale: str) -> str:
+    import release_notes
+
+    # bypass the caches to time the work itself
+    try:
+        transformed = release_notes._apply.__wrapped__(rules, notes)
+    except ValueError as e:
+        return repr(e)
+    return release_notes.normalize.__wrapped__(transformed, owner_and_repo, locale)
+
+
+def _time(fn: Callable[[], str], repeat: int) -> tuple[float, str]:
+    best = float("inf")
+    for _ in range(repeat):
+        started = perf_counter()
+        result = fn()
+        best = min(best, perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = ArgumentParser(
+        description="Compare release_notes.py with the regex chains it replaced"
+    )
+    parser.add_argument(
+        "--corpus", default=CORPUS_DIR, help="one directory of .md files per package"
+    )
+    parser.add_argument("--fetch", type=int, metavar="PAGES", help="download the corpus first")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+
+    if args.fetch:
+        fetch(args.corpus, args.fetch)
+
+    documents = [
+        (moniker, os.path.basename(path), _read(path))
+        for moniker in PACKAGES
+        for path in sorted(glob(os.path.join(args.corpus, moniker, "*.md")))
+    ]
+    if not documents:
+        print(f"No corpus in {args.corpus}, run with --fetch 1 to download one")
+    documents += [("ruff", name, notes) for name, notes in _get_adversarial().items()]
+
+    old_total = new_total = 0
+    mismatches = 0
+    for moniker, name, notes in documents:
+        owner_and_repo, locale = PACKAGES[moniker]
+        rules = __import__(moniker)._RULES
+
+        old = partial(_old, _OLD_TRANSFORMS[moniker], notes, owner_and_repo, locale)
+        new = partial(_new, rules, notes, owner_and_repo, locale)
+        old_seconds, old_result = _time(old, args.repeat)
+        new_seconds, new_result = _time(new, args.repeat)
+        old_total += old_seconds
+        new_total += new_seconds
+        if old_result != new_result and not old_result.startswith("ValueError"):
+            mismatches += 1
+            print(f"[{moniker}/{name}] output differs")
+        if old_seconds > 0.01 or new_seconds > 0.01:
+            print(
+                f"{moniker}/{name}: {len(notes) / 1024:.0f} KiB,"
+                f" {old_seconds * 1000:.1f} ms -> {new_seconds * 1000:.1f} ms"
+            )
+
+    print(
+        f"{len(documents)} documents, {mismatches} with different output,"
+        f" {old_total * 1000:.1f} ms -> {new_total * 1000:.1f} ms"
+    )
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from time import perf_counter
+from traceback import print_exception
+from typing import TypedDict
+
+import rich
+from rich import print
+
+import github
+import journal
+import latency
+import metrics
+import probe
+import profiling
+import tracing
+from common import CLIENT, UpdateArgs, prewarm
+from manifest import Installer
+
+
+class Item(TypedDict):
+    identifier: str
+    version: str
+    installers: list[Installer]
+    args: UpdateArgs
+
+
+class Result(TypedDict, total=False):
+    identifier: str
+    version: str
+    blocking_pr: int | None
+    error: str
+    seconds: float
+
+
+def read_items(lines: Iterable[str]) -> list[Item]:
+    items: dict[tuple[str, str], Item] = {}
+    for line in lines:
+        if not (line := line.strip()):
+            continue
+        item: Item = json.loads(line)
+        assert item["identifier"] and item["version"] and item["installers"], line
+        args = item.setdefault("args", {"base_version": ""})
+        args.setdefault("base_version", "")
+        if release_date := args.get("release_date"):
+            args["release_date"] = date.fromisoformat(release_date)  # type: ignore
+        if release_notes := args.get("release_notes"):
+            args["release_notes"] = {locale: tuple(x) for locale, x in release_notes.items()}  # type: ignore
+        # a later line for the same version replaces the earlier one
+        key = item["identifier"], item["version"]
+        items.pop(key, None)
+        items[key] = item
+    return list(items.values())
+
+
+def _update_all(items: list[Item]) -> list[Result]:
+    # versions of one identifier share a manifest directory, so they go one after another
+    results = []
+    for item in items:
+        identifier, version = item["identifier"], item["version"]
+        result: Result = {"identifier": identifier, "version": version}
+        started = perf_counter()
+        try:
+            with metrics.package(identifier), tracing.span(identifier, version=version):
+                probe.clear(identifier)
+                github.resume_pending(identifier)
+                result["blocking_pr"] = github.update(
+                    identifier, version, item["installers"], item["args"]
+                )
+        except Exception as e:
+            print_exception(e)
+            result["error"] = repr(e)
+        else:
+            journal.discard(identifier)
+        result["seconds"] = round(perf_counter() - started, 3)
+        results.append(result)
+    return results
+
+
+def run(items: list[Item], output: str, concurrency: int) -> bool:
+    github.check_repo_and_delete_merged_branches()
+
+    groups: dict[str, list[Item]] = {}
+    for item in items:
+        groups.setdefault(item["identifier"], []).append(item)
+
+    ok = True
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f, ThreadPoolExecutor(concurrency, "bulk") as executor:
+        for results in executor.map(_update_all, groups.values()):
+            for result in results:
+                ok = ok and "error" not in result
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+    if ok:
+        github.delete_fork_if_should()
+    return ok
+
+
+def main():
+    parser = ArgumentParser(description="Submit a JSONL stream of updates")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file, or - for stdin")
+    parser.add_argument("--output", default=f"{metrics.REPORTS_DIR}/bulk.jsonl")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--profile", action="store_true", help="profile the updates with cProfile")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.ENABLED = True
+
+    rich.reconfigure(force_terminal=True, width=4096)
+    prewarm("https://api.github.com/")
+    if args.input == "-":
+        items = read_items(sys.stdin)
+    else:
+        with open(args.input) as f:
+            items = read_items(f)
+    print(f"Read {len(items)} updates")
+    try:
+        with profiling.package("bulk"):
+            ok = run(items, args.output, args.concurrency)
+    finally:
+        CLIENT.close()
+        metrics.write_report()
+        tracing.write_trace()
+        profiling.write_report()
+        latency.write_textfile()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
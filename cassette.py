@@ -0,0 +1,177 @@
+import atexit
+import json
+import os
+import zipfile
+from collections import defaultdict
+from collections.abc import Iterator
+from hashlib import sha256
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from threading import Lock
+from time import perf_counter, sleep
+from typing import Literal, TypedDict
+
+import httpx
+
+type Mode = Literal["record", "replay"]
+
+# a 304 only answers a request that carried these, so they are recorded and matched
+_CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+
+
+class _Interaction(TypedDict):
+    method: str
+    url: str
+    body: str | None
+    shape: str | None
+    conditions: str | None
+    status: int
+    headers: list[tuple[str, str]]
+    content: str
+    elapsed: float
+
+
+def _digest(data: bytes) -> str:
+    return sha256(data).hexdigest()
+
+
+def _get_shape(body: bytes) -> str | None:
+    # GraphQL requests share one URL, so the query text tells operations apart
+    # even when their variables (e.g. timestamped branch names) differ between runs
+    try:
+        return _digest(json.loads(body)["query"].encode())
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def _get_conditions(request: httpx.Request) -> str | None:
+    values = [request.headers.get(name, "") for name in _CONDITIONAL_HEADERS]
+    return "\n".join(values) if any(values) else None
+
+
+class _FileStream(httpx.SyncByteStream):
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __iter__(self) -> Iterator[bytes]:
+        with open(self.path, "rb") as f:
+            while chunk := f.read(1 << 16):
+                yield chunk
+
+
+class RecordingTransport(httpx.BaseTransport):
+    # bodies go to temporary files as they arrive, so recording a run never holds an installer
+    # in memory; the cassette is written on close, or at exit for scripts that never close
+    def __init__(self, inner: httpx.BaseTransport, path: str) -> None:
+        self.inner = inner
+        self.path = path
+        self.interactions: list[_Interaction] = []
+        self.blobs = TemporaryDirectory(prefix="cassette-")
+        self.lock = Lock()
+        self.is_closed = False
+        atexit.register(self.close)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        started = perf_counter()
+        response = self.inner.handle_request(request)
+        h = sha256()
+        try:
+            with NamedTemporaryFile(dir=self.blobs.name, delete=False) as f:
+                for chunk in response.iter_raw():
+                    h.update(chunk)
+                    f.write(chunk)
+        finally:
+            response.close()
+        os.replace(f.name, blob := f"{self.blobs.name}/{(digest := h.hexdigest())}")
+        with self.lock:
+            self.interactions.append({
+                "method": request.method,
+                "url": str(request.url),
+                "body": _digest(body) if body else None,
+                "shape": _get_shape(body),
+                "conditions": _get_conditions(request),
+                "status": response.status_code,
+                "headers": response.headers.multi_items(),
+                "content": digest,
+                "elapsed": perf_counter() - started,
+            })
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_FileStream(blob),
+            extensions=response.extensions,
+        )
+
+    def close(self) -> None:
+        with self.lock:
+            if self.is_closed:
+                return
+            self.is_closed = True
+        atexit.unregister(self.close)
+        self.inner.close()
+        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as cassette:
+            cassette.writestr("interactions.json", json.dumps(self.interactions, indent=1))
+            for digest in os.listdir(self.blobs.name):
+                cassette.write(f"{self.blobs.name}/{digest}", f"blobs/{digest}")
+        self.blobs.cleanup()
+        print(f"Recorded {len(self.interactions)} requests to {self.path}")
+
+
+class ReplayTransport(httpx.BaseTransport):
+    def __init__(self, path: str, latency: str | None = None) -> None:
+        self.cassette = zipfile.ZipFile(path)
+        self.latency = latency
+        self.queues: dict[tuple, list[_Interaction]] = defaultdict(list)
+        for interaction in json.loads(self.cassette.read("interactions.json")):
+            is_conditional = bool(interaction.get("conditions"))
+            key = interaction["method"], interaction["url"], interaction["shape"], is_conditional
+            self.queues[key].append(interaction)
+        self.recorded = sum(map(len, self.queues.values()))
+        self.replayed = 0
+        self.lock = Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        digest = _digest(body) if body else None
+        conditions = _get_conditions(request)
+        key = request.method, str(request.url), _get_shape(body)
+        with self.lock:
+            # a conditional request may also be answered in full, an unconditional one never by a 304
+            if not (queue := conditions and self.queues.get((*key, True))) and not (
+                queue := self.queues.get((*key, False))
+            ):
+                raise httpx.ConnectError(f"Not in cassette: {request.method} {request.url}")
+            # prefer an exact body (and validator) match, otherwise replay in recorded order;
+            # the last response is kept to answer repeated requests
+            matches = [i for i, x in enumerate(queue) if x["body"] == digest]
+            exact = [i for i in matches if queue[i].get("conditions") == conditions]
+            index = (exact or matches or [0])[0]
+            interaction = queue.pop(index) if len(queue) > 1 else queue[0]
+            self.replayed += 1
+            content = self.cassette.read(f"blobs/{interaction['content']}")
+
+        if self.latency == "recorded":
+            sleep(interaction["elapsed"])
+        elif self.latency:
+            sleep(float(self.latency) / 1000)
+        return httpx.Response(
+            interaction["status"],
+            headers=interaction["headers"],
+            stream=httpx.ByteStream(content),
+        )
+
+    def close(self) -> None:
+        self.cassette.close()
+        unused = sum(map(len, self.queues.values())) - len(self.queues)
+        print(
+            f"Replayed {self.replayed} requests, {self.recorded} recorded ({unused} never requested)"
+        )
+
+
+def wrap(
+    transport: httpx.BaseTransport, path: str, mode: Mode, latency: str | None
+) -> httpx.BaseTransport:
+    if mode == "record":
+        return RecordingTransport(transport, path)
+    assert mode == "replay", mode
+    return ReplayTransport(path, latency)
@@ -0,0 +1,71 @@
+import os
+import re
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# only needed once a package actually changes
+HEAVY_MODULES = ("ruamel.yaml", "rich.syntax", "pygments", "pangu")
+
+_LINE_REGEX = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| *(\S+)")
+
+
+def _get_import_times() -> list[tuple[int, int, str]]:
+    # no configuration in the environment: importing must not need any
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if not key.startswith(("GITHUB_", "FORK_POLICY", "PROFILE"))
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    return [
+        (int(own), int(cumulative), name)
+        for own, cumulative, name in _LINE_REGEX.findall(result.stderr)
+    ]
+
+
+def main():
+    parser = ArgumentParser(description="Check the import time of main.py and a no-update run")
+    parser.add_argument("--budget-ms", type=float, default=500, help="for importing main")
+    parser.add_argument("--repeat", type=int, default=3, help="the fastest import counts")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to show")
+    args = parser.parse_args()
+
+    failures = []
+    runs = [_get_import_times() for _ in range(args.repeat)]
+    times = min(runs, key=lambda times: next(c for _, c, name in times if name == "main"))
+    total = next(cumulative for _, cumulative, name in times if name == "main") / 1000
+    for own, cumulative, name in sorted(times, reverse=True)[: args.top]:
+        print(f"{own / 1000:7.1f} ms {cumulative / 1000:7.1f} ms  {name}")
+    print(f"Importing main took {total:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if total > args.budget_ms:
+        failures.append(f"importing main took {total:.1f} ms")
+    imported = {name for *_, name in times}
+    if heavy := [m for m in HEAVY_MODULES if m in imported]:
+        failures.append(f"importing main loads {', '.join(heavy)}")
+
+    sys.path.insert(0, ROOT)
+    import bench
+
+    os.environ.update({"GITHUB_TOKEN": "bench", "GITHUB_REPOSITORY_OWNER": bench.OWNER})
+    result = bench.bench("nothing-changed", 2**20, False, None)
+    loaded = set(result["modules"])
+    if heavy := [m for m in HEAVY_MODULES if m in loaded]:
+        failures.append(f"a run without updates loads {', '.join(heavy)}")
+
+    for failure in failures:
+        print(f"::error title=Import time::{failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,82 @@
+import json as _json
 import re
+from collections.abc import Iterable, Iterator
 from datetime import date
 from io import BytesIO
+from os import getenv
 from os.path import isfile
 from sys import stderr, stdout
+from threading import Thread
 from time import sleep
-from typing import Required, Sequence, TypedDict
+from typing import Any, Required, Sequence, TypedDict
 
 import httpx
 
-CLIENT = httpx.Client(timeout=30, follow_redirects=True, transport=httpx.HTTPTransport(retries=3))
+import metrics
+
+
+_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=30)
+_DOWNLOAD_LIMITS = httpx.Limits(max_connections=8, max_keepalive_connections=4, keepalive_expiry=30)
+# each class of host gets its own pool, so installer downloads can't hold the connections that
+# API calls need; api.github.com multiplexes every call over HTTP/2
+_POOLS: dict[str, tuple[bool, httpx.Limits]] = {
+    "https://api.github.com": (
+        True,
+        httpx.Limits(max_connections=4, max_keepalive_connections=4, keepalive_expiry=120),
+    ),
+    "https://github.com": (False, _DOWNLOAD_LIMITS),
+    "https://*.githubusercontent.com": (False, _DOWNLOAD_LIMITS),
+}
+
+
+# loading the CA bundle is the slow part of creating a transport, so they share one context
+_SSL_CONTEXT = httpx.create_ssl_context()
+
+
+def _get_transport() -> httpx.BaseTransport:
+    transport = httpx.HTTPTransport(verify=_SSL_CONTEXT, retries=3, limits=_LIMITS)
+    if cassette_path := getenv("HTTP_CASSETTE"):
+        import cassette
+
+        mode = getenv("HTTP_CASSETTE_MODE", "replay")
+        assert mode in {"record", "replay"}, mode
+        transport = cassette.wrap(transport, cassette_path, mode, getenv("HTTP_CASSETTE_LATENCY"))
+    return transport
+
+
+def _get_mounts() -> dict[str, httpx.BaseTransport]:
+    if getenv("HTTP_CASSETTE"):
+        return {}  # one cassette records every host
+    return {
+        pattern: httpx.HTTPTransport(verify=_SSL_CONTEXT, retries=3, http2=http2, limits=limits)
+        for pattern, (http2, limits) in _POOLS.items()
+    }
+
+
+def make_client(transport: httpx.BaseTransport | None = None) -> httpx.Client:
+    # a given transport serves every host, e.g. bench.py's stand-in server
+    return httpx.Client(
+        timeout=30,
+        follow_redirects=True,
+        transport=transport or _get_transport(),
+        mounts=None if transport else _get_mounts(),
+        event_hooks={"request": [metrics.on_request], "response": [metrics.on_response]},
+    )
+
+
+CLIENT = make_client()
+
+
+def prewarm(*urls: str) -> None:
+    # connects in the background while the run starts; a failure is left to the real request
+    def connect(url: str):
+        try:
+            CLIENT.head(url)
+        except httpx.HTTPError:
+            pass
+
+    for url in urls:
+        Thread(target=connect, args=(url,), name="prewarm", daemon=True).start()
 
 
 def get(url: str):
@@ -26,21 +94,60 @@ def retry_request(
     retries = 5
     while True:
         try:
-            return CLIENT.request(method, url, json=json, headers=headers)
+            response = CLIENT.request(method, url, json=json, headers=headers)
         except httpx.TimeoutException:
             if (retries := retries - 1) == 0:
                 raise
+            metrics.on_retry(method, url)
             sleep(1)
+        else:
+            metrics.on_body(response)
+            return response
+
+
+_JSON_DECODER = _json.JSONDecoder()
+_JSON_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    # yields the objects of a top-level JSON array as each one completes, so a caller that
+    # stops early never downloads or parses the rest
+    buffer = ""
+    is_started = False
+    for chunk in chunks:
+        buffer += chunk
+        position = 0
+        if not is_started:
+            if not (buffer := buffer.lstrip()):
+                continue
+            assert buffer[0] == "[", buffer[:100]
+            is_started, position = True, 1
+        while True:
+            position = _JSON_SEPARATORS.match(buffer, position).end()  # type: ignore
+            if buffer.startswith("]", position):
+                return
+            if not buffer.startswith("{", position) or buffer.find("}", position) < 0:
+                break
+            try:
+                value, position = _JSON_DECODER.raw_decode(buffer, position)
+            except _json.JSONDecodeError:
+                break  # the object continues in the next chunk
+            yield value
+        buffer = buffer[position:]
+    raise ValueError("unterminated JSON array")
 
 
 class UpdateArgs(TypedDict, total=False):
     base_version: Required[str]
     release_date: date
+    published_at: str
     release_notes: dict[str, tuple[str, str]]
     owner_and_repo: str
     keep_notes_on_version_prefix: str
     is_url_important: bool
     override_old_installers: bool
+    # base installers are matched to new ones by architecture, so the count may change
+    merge_installers_by_architecture: bool
     should_force_rerun: bool
 
 
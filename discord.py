@@ -1,28 +1,63 @@
 import json
+from functools import partial
 
+import journal
+import probe
+import state
 from common import get
 from github import update
+from manifest import Installer
 
 
 def main():
-    with open("discord.txt") as f:
-        x64, x86 = map(int, f.read().split(","))
-        versions = {"x64": x64, "x86": x86}
+    x64, x86 = map(int, (old_state := state.read("discord.txt")).split(","))
+    versions = {"x64": x64, "x86": x86}
 
+    latest = probe.run({arch: partial(_get_latest_version, arch) for arch in versions})
+    new_versions: dict[str, int] = {}
     for arch, old_version in versions.items():
-        url = f"https://updates.discord.com/distributions/app/manifests/latest?channel=stable&platform=win&arch={arch}"
-        triple: list[int] = json.loads(get(url))["full"]["host_version"]
-        assert triple[:2] == [1, 0]
-        assert (new_version := triple[2]) >= old_version
+        assert (new_version := latest[arch]) >= old_version
         if new_version > old_version:
-            url = f"https://dl.discordapp.net/distro/app/stable/win/{arch}/1.0.{new_version}/DiscordSetup.exe"
+            new_versions[arch] = new_version
+
+    # a version holds one installer per architecture it was released for, so a version's
+    # installers are merged into its base by architecture rather than replacing them
+    if len(new_versions) == len(versions) and len(set(new_versions.values())) == 1:
+        # both architectures moved to the same build, so one update carries every installer
+        new_version = new_versions["x64"]
+        update(
+            "Discord.Discord",
+            f"1.0.{new_version}",
+            [_get_installer(arch, new_version) for arch in new_versions],
+            {
+                "base_version": f"1.0.{max(versions.values())}",
+                "merge_installers_by_architecture": True,
+            },
+        )
+    else:
+        for arch, new_version in new_versions.items():
             update(
                 "Discord.Discord",
                 f"1.0.{new_version}",
-                [{"Architecture": arch, "InstallerUrl": url}],
-                {"base_version": f"1.0.{old_version}"},
+                [_get_installer(arch, new_version)],
+                {
+                    "base_version": f"1.0.{versions[arch]}",
+                    "merge_installers_by_architecture": True,
+                },
             )
-            versions[arch] = new_version
+    versions.update(new_versions)
+
+    state.write("discord.txt", f"{versions['x64']},{versions['x86']}", expected=old_state)
+    journal.discard("Discord.Discord")
+
+
+def _get_latest_version(arch: str) -> int:
+    url = f"https://updates.discord.com/distributions/app/manifests/latest?channel=stable&platform=win&arch={arch}"
+    triple: list[int] = json.loads(get(url))["full"]["host_version"]
+    assert triple[:2] == [1, 0]
+    return triple[2]
+
 
-    with open("discord.txt", "w") as f:
-        f.write(f"{versions['x64']},{versions['x86']}")
+def _get_installer(arch: str, version: int) -> Installer:
+    url = f"https://dl.discordapp.net/distro/app/stable/win/{arch}/1.0.{version}/DiscordSetup.exe"
+    return {"Architecture": arch, "InstallerUrl": url}
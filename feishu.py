@@ -1,9 +1,15 @@
 import json
+from argparse import ArgumentParser
 from os import getenv
 from typing import Any
 
 import rich
 
+import journal
+import latency
+import metrics
+import profiling
+import tracing
 from github import update
 
 
@@ -43,7 +49,19 @@ def main():
             },
         },
     )
+    journal.discard("ByteDance.Feishu")
 
 
 if __name__ == "__main__":
-    main()
+    parser = ArgumentParser()
+    parser.add_argument("--profile", action="store_true", help="profile the update with cProfile")
+    if parser.parse_args().profile:
+        profiling.ENABLED = True
+    try:
+        with metrics.package("feishu"), tracing.span("feishu"), profiling.package("feishu"):
+            main()
+    finally:
+        metrics.write_report()
+        tracing.write_trace()
+        profiling.write_report()
+        latency.write_textfile()
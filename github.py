@@ -1,20 +1,32 @@
+import json as _json
 from base64 import b64encode
-from datetime import datetime
+from collections import OrderedDict
+from datetime import UTC, datetime
+from functools import cache, lru_cache
+from hashlib import sha256
 from os import getenv
 from os.path import expandvars
 from pprint import pformat
+from threading import Lock
 from time import sleep
-from typing import Any, Callable, Literal, Sequence, TypedDict
+from typing import Any, Callable, Generator, Iterator, Literal, Sequence, TypedDict
 
+from httpx import Response, TimeoutException
 from rich import print
 
-from common import UpdateArgs, Version, retry_request, try_parse_version
+import journal
+import latency
+import metrics
+from common import (
+    CLIENT,
+    UpdateArgs,
+    Version,
+    iter_json_array,
+    retry_request,
+    try_parse_version,
+)
 from manifest import Installer, Manifests, fill_in_release_notes, update_new_version
-
-assert (_TOKEN := getenv("GITHUB_TOKEN"))
-HEADERS = {"Authorization": f"token {_TOKEN}"}
-
-assert (OWNER := getenv("GITHUB_REPOSITORY_OWNER"))
+from tracing import span, traced
 
 MICROSOFT = "microsoft"
 WINGET_PKGS = "winget-pkgs"
@@ -25,10 +37,79 @@ DEFAULT_BRANCH = "master"
 type PRNumber = int
 
 
+# configuration is read on first use, so importing this module has no requirements
+
+
+@cache
+def _get_headers() -> dict[str, str]:
+    assert (token := getenv("GITHUB_TOKEN"))
+    return {"Authorization": f"token {token}"}
+
+
+@cache
+def _get_owner() -> str:
+    assert (owner := getenv("GITHUB_REPOSITORY_OWNER"))
+    return owner
+
+
+@cache
+def _get_fork_policy() -> str:
+    # "delete" removes the fork after a run that left no branches behind, "keep" never does,
+    # which saves the fork setup round-trips on the next new version
+    policy = getenv("FORK_POLICY", "delete")
+    assert policy in {"delete", "keep"}
+    return policy
+
+
 def get_gh_api(url: str) -> Any:
     return _rest("GET", url)
 
 
+def get_release_by_tag(owner_and_repo: str, tag: str) -> dict | None:
+    # re-checks within a process are answered from the ETag cache with a 304
+    return _rest(
+        "GET",
+        f"/repos/{owner_and_repo}/releases/tags/{tag}",
+        accept_error=lambda response: response.status_code == 404,
+    )
+
+
+def iter_releases(owner_and_repo: str, *, per_page: int = 30) -> Iterator[dict]:
+    # newest first, page after page, parsed while it downloads; stopping the iteration closes the
+    # connection
+    url = f"https://api.github.com/repos/{owner_and_repo}/releases?per_page={per_page}"
+    while url:
+        url = yield from _iter_release_page(url)
+
+
+def _iter_release_page(url: str) -> Generator[dict, None, str | None]:
+    # timeouts and server errors are retried like retry_request does, even part-way through,
+    # in which case the releases that were already yielded are skipped
+    yielded = 0
+    for attempt in range(retries := 5):
+        if attempt:
+            metrics.on_retry("GET", url)
+            sleep(1)
+        is_last = attempt == retries - 1
+        try:
+            with CLIENT.stream("GET", url, headers=_get_headers()) as response:
+                try:
+                    if response.is_server_error and not is_last:
+                        continue
+                    assert response.is_success, response.status_code
+                    for i, release in enumerate(iter_json_array(response.iter_text())):
+                        if i == yielded:
+                            yielded += 1
+                            yield release
+                    return response.links.get("next", {}).get("url")
+                finally:
+                    metrics.on_body(response)
+        except TimeoutException:
+            if is_last:
+                raise
+
+
+@traced
 def update(
     identifier: str,
     version: str,
@@ -41,6 +122,23 @@ def update(
     else:
         print(" without release notes...")
 
+    inputs = _hash_inputs(installers, args)
+    if (entry := journal.load(identifier, version)) and entry["step"] != "detected":
+        if entry.get("inputs") == inputs:
+            print(f"Resuming interrupted update after step {entry['step']!r}...")
+            return _submit(entry)
+        print(f"Restarting interrupted update after step {entry['step']!r} with new inputs...")
+    entry = {
+        "identifier": identifier,
+        "version": version,
+        "package": metrics.PACKAGE.get(),
+        "inputs": inputs,
+    }
+    entry["detected_at"] = datetime.now(UTC).isoformat()
+    if published_at := args.get("published_at"):
+        entry["published_at"] = published_at
+    journal.record(entry, "detected")
+
     prs = _get_existing_prs(identifier, version)
     print(f"Found {len(prs)} existing PRs")
 
@@ -51,7 +149,7 @@ def update(
         print(f"({i+1}) ", end="")
         _print_pr(pr)
 
-        if pr["headRepositoryOwner"] == OWNER:
+        if pr["headRepositoryOwner"] == _get_owner():
             if pr["state"] == "OPEN":
                 assert owner_open_pr is None
                 owner_open_pr = pr
@@ -74,9 +172,10 @@ def update(
         sha = ref["sha"]
     else:
         print(f"Checking {DEFAULT_BRANCH} branch...")
-        refs = _rest(
-            "GET", f"/repos/{MICROSOFT_WINGET_PKGS}/git/matching-refs/heads/{DEFAULT_BRANCH}"
-        )
+        with span("github.get_default_branch"):
+            refs = _rest(
+                "GET", f"/repos/{MICROSOFT_WINGET_PKGS}/git/matching-refs/heads/{DEFAULT_BRANCH}"
+            )
         assert len(refs) == 1
         sha = refs[0]["object"]["sha"]
 
@@ -94,46 +193,122 @@ def update(
         message_prefix = "Modify"
     elif not args.get("release_notes") or not fill_in_release_notes(manifests, identifier, args):
         print("This branch is up-to-date, we'll mark this update as done")
+        journal.remove(identifier, version)
         return None
     elif other_open_pr and not owner_open_pr:
         print("We need to wait until this PR gets merged")
+        journal.remove(identifier, version)
         return other_open_pr["number"]
 
     del other_open_pr
 
     if message_prefix != "ReleaseNotes":
         manifests = _get_base_manifests(identifier, args, sha=sha)
-        update_new_version(manifests, identifier, version, installers, args)
-
-    message = f"{message_prefix}: {identifier} version {version}"
+        last_modified = update_new_version(manifests, identifier, version, installers, args)
+        _generated_manifests[identifier, version] = manifests.copy()
+        if last_modified and "published_at" not in entry:
+            entry["published_at"] = last_modified.isoformat()
+
+    entry["message"] = f"{message_prefix}: {identifier} version {version}"
+    entry["path"] = path
+    entry["sha"] = sha
+    entry["manifests"] = manifests
     if owner_open_pr:
-        _create_commit(ref["name"], message, path, manifests, sha)
-        print("[green]✓ Updated existing pull request[/]")
-        return None
-
-    create_fork()
-    _sync_fork()
-    branch_name = f"{identifier}-{version}--{datetime.now():%Y%m%d-%H%M%S}"
-    print(f"Creating new branch {branch_name!r}...")
-    _create_branch(branch_name, sha)
-    commit_url = _create_commit(branch_name, message, path, manifests, sha)
-    print(f"Created commit: {commit_url}")
-    pr_url = _create_pr(message, branch_name)
-    print(f"Created PR: {pr_url}")
+        entry["branch_name"] = ref["name"]
+        entry["is_new_branch"] = False
+    else:
+        entry["branch_name"] = f"{identifier}-{version}--{datetime.now():%Y%m%d-%H%M%S}"
+        entry["is_new_branch"] = True
+    journal.record(entry, "hashed")
+    return _submit(entry)
+
+
+@traced
+def _submit(entry: journal.Entry) -> None:
+    branch_name = entry["branch_name"]
+    if entry["step"] == "hashed" and entry["is_new_branch"]:
+        create_fork()
+        print(f"Creating new branch {branch_name!r}...")
+        _create_branch(branch_name, entry["sha"])
+        journal.record(entry, "branch_created")
+
+    if entry["step"] in {"hashed", "branch_created"}:
+        entry["commit_url"] = _create_commit(
+            branch_name, entry["message"], entry["path"], entry["manifests"], entry["sha"]
+        )
+        journal.record(entry, "committed")
+        if not entry["is_new_branch"]:
+            print("[green]✓ Updated existing pull request[/]")
+            return None
+        print(f"Created commit: {entry['commit_url']}")
+
+    if entry["step"] == "committed" and entry["is_new_branch"]:
+        entry["pr_url"] = _create_pr(entry["message"], branch_name)
+        entry["pr_opened_at"] = datetime.now(UTC).isoformat()
+        journal.record(entry, "pr_opened")
+        latency.record(entry)
+        print(f"Created PR: {entry['pr_url']}")
     return None
 
 
-def _rest(method: str, url: str, *, json: dict | None = None) -> Any:
+def _hash_inputs(installers: Sequence[Installer], args: UpdateArgs) -> str:
+    # a journaled update only resumes with the inputs it was started with
+    data = _json.dumps([installers, args], sort_keys=True, default=str)
+    return sha256(data.encode()).hexdigest()
+
+
+@traced
+def resume_pending(package: str):
+    # only the package's own entries: its run writes the state that discards them
+    for entry in journal.pending():
+        if entry.get("package") != package or entry["step"] in {"detected", "pr_opened"}:
+            continue
+        print(f"Resuming interrupted update of {entry['identifier']!r} to {entry['version']}...")
+        _submit(entry)
+
+
+# least recently used last; bounded because the daemon keeps this module for its lifetime
+_ETAG_CACHE_SIZE = 256
+_etag_cache: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+_etag_lock = Lock()
+
+
+def _rest(
+    method: str,
+    url: str,
+    *,
+    json: dict | None = None,
+    accept_error: Callable[[Response], bool] | None = None,
+) -> Any:
     if url.startswith("/"):
         url = f"https://api.github.com{url}"
     else:
         assert url.startswith("https://api.github.com")
-    response = retry_request(method, url, json=json, headers=HEADERS)
+    headers = _get_headers()
+    cached = None
+    if method == "GET":
+        with _etag_lock:
+            if cached := _etag_cache.get(url):
+                _etag_cache.move_to_end(url)
+    if cached:
+        headers = {**headers, "If-None-Match": cached[0]}
+    response = retry_request(method, url, json=json, headers=headers)
+    if response.status_code == 304:
+        assert cached
+        return _json.loads(cached[1])
     if response.status_code == 204:
         assert not response.content
         return None
     payload = response.json()
+    if method == "GET" and response.is_success and (etag := response.headers.get("ETag")):
+        with _etag_lock:
+            _etag_cache[url] = (etag, response.content)
+            _etag_cache.move_to_end(url)
+            while len(_etag_cache) > _ETAG_CACHE_SIZE:
+                _etag_cache.popitem(last=False)
     if not response.is_success:
+        if accept_error is not None and accept_error(response):
+            return None
         raise RuntimeError(pformat(payload, sort_dicts=False))
     return payload
 
@@ -148,7 +323,7 @@ def _graphql(query: str, variables: dict = {}, accept_error: Callable[[list], bo
         "POST",
         "https://api.github.com/graphql",
         json={"query": query, "variables": variables},
-        headers=HEADERS,
+        headers=_get_headers(),
     )
     assert response.is_success, response.text
     payload = response.json()
@@ -181,6 +356,7 @@ def _print_pr(pr: _PullRequest):
     print(pr["url"])
 
 
+@traced
 def _get_existing_prs(identifier: str, version: str) -> list[_PullRequest]:
     result = _graphql(
         """query PullRequestSearch($q: String!) { search(query: $q, type: ISSUE, first: 30) {"""
@@ -198,52 +374,109 @@ def _get_existing_prs(identifier: str, version: str) -> list[_PullRequest]:
     return result
 
 
+@traced
 def _create_branch(name: str, sha: str):
+    # The fork shares its object storage with upstream, so the branch can usually be
+    # created on the upstream OID directly; only sync when the fork can't see it yet.
+    # A 422 is also the answer when an interrupted attempt already created this branch
     payload = {"ref": f"refs/heads/{name}", "sha": sha}
-    _rest("POST", f"/repos/{OWNER}/{WINGET_PKGS}/git/refs", json=payload)
+    url = f"/repos/{_get_owner()}/{WINGET_PKGS}/git/refs"
+    if (
+        not _rest("POST", url, json=payload, accept_error=lambda r: r.status_code == 422)
+        and _get_branch_sha(name) != sha
+    ):
+        _sync_fork()
+        _rest("POST", url, json=payload)
     global _should_delete_fork
     _should_delete_fork = False
 
 
-def _sync_fork():
-    print("Syncing fork with upstream...")
-    _rest(
-        "POST",
-        f"/repos/{OWNER}/{WINGET_PKGS}/merge-upstream",
-        json={"branch": DEFAULT_BRANCH},
+def _get_branch_sha(name: str) -> str | None:
+    ref = _rest(
+        "GET",
+        f"/repos/{_get_owner()}/{WINGET_PKGS}/git/ref/heads/{name}",
+        accept_error=lambda r: r.status_code == 404,
     )
+    return ref and ref["object"]["sha"]
+
+
+@traced
+def _sync_fork():
+    global _is_fork_synced
+    with _fork_lock:
+        if _is_fork_synced:
+            return
+        print("Syncing fork with upstream...")
+        _rest(
+            "POST",
+            f"/repos/{_get_owner()}/{WINGET_PKGS}/merge-upstream",
+            json={"branch": DEFAULT_BRANCH},
+        )
+        _is_fork_synced = True
 
 
+@traced
 def create_fork() -> None:
-    global _owner_repo_id, _should_delete_fork
+    global _should_delete_fork
     _should_delete_fork = False
-    if _owner_repo_id:
-        return
+    with _fork_lock:
+        if not _owner_repo_id:
+            _setup_fork()
+
+
+def _setup_fork():
+    global _owner_repo_id
     print("Creating fork...")
     _owner_repo_id = _rest(
         "POST", f"/repos/{MICROSOFT_WINGET_PKGS}/forks", json={"default_branch_only": True}
     )["node_id"]
     _rest(
         "PATCH",
-        f"/repos/{OWNER}/{WINGET_PKGS}",
+        f"/repos/{_get_owner()}/{WINGET_PKGS}",
         json={"has_issues": False, "has_wiki": False, "has_projects": False},
     )
     _rest(
         "PUT",
-        f"/repos/{OWNER}/{WINGET_PKGS}/actions/permissions",
+        f"/repos/{_get_owner()}/{WINGET_PKGS}/actions/permissions",
         json={"enabled": False},
     )
-    print("Sleeping 5 seconds to let the fork settle...")
-    sleep(5)
-
-
+    _wait_for_fork()
+
+
+@traced
+def _wait_for_fork():
+    delay = 0.5
+    for _ in range(8):
+        if _rest(
+            "GET",
+            f"/repos/{_get_owner()}/{WINGET_PKGS}/branches/{DEFAULT_BRANCH}",
+            accept_error=lambda r: r.status_code in {404, 409},
+        ):
+            return
+        print(f"Fork is not ready yet, retrying in {delay} seconds...")
+        sleep(delay)
+        delay *= 2
+    raise RuntimeError("Fork is not ready")
+
+
+@traced
 def delete_fork_if_should():
     if not _owner_repo_id or not _should_delete_fork:
         return
+    if _get_fork_policy() == "keep":
+        print("Keeping fork")
+        return
+    _delete_fork()
+
+
+def _delete_fork():
+    global _owner_repo_id
     print("Deleting fork...")
-    _rest("DELETE", f"/repos/{OWNER}/{WINGET_PKGS}")
+    _rest("DELETE", f"/repos/{_get_owner()}/{WINGET_PKGS}")
+    _owner_repo_id = None
 
 
+@lru_cache(maxsize=256)  # trees are immutable once addressed by commit SHA
 def _get_directory(sha: str, path: str) -> dict:
     response = _graphql(
         """query GetDirectoryContentWithText($owner: String!, $name: String!, $expression: String!) {"""
@@ -258,6 +491,7 @@ def _get_directory(sha: str, path: str) -> dict:
     return response
 
 
+@traced
 def _get_manifests(sha: str, path: str) -> Manifests:
     response = _get_directory(sha, path)
     if response["repository"]["object"] is None:
@@ -268,6 +502,7 @@ def _get_manifests(sha: str, path: str) -> Manifests:
     }
 
 
+@traced
 def _get_subdirectories(sha: str, path: str) -> list[str]:
     response = _get_directory(sha, path)
     return [
@@ -282,10 +517,17 @@ def _get_path(identifier: str, version: str | None = None) -> str:
     return base if version is None else f"{base}/{version}"
 
 
+# manifests this run submitted, the base of the next version when catching up on several
+_generated_manifests: dict[tuple[str, str], Manifests] = {}
+
+
+@traced
 def _get_base_manifests(identifier: str, args: UpdateArgs, *, sha: str) -> Manifests:
     if (base_version := args.get("base_version")) and (
-        manifests := _get_manifests(sha, _get_path(identifier, base_version))
+        manifests := _generated_manifests.get((identifier, base_version))
     ):
+        return manifests.copy()
+    if base_version and (manifests := _get_manifests(sha, _get_path(identifier, base_version))):
         return manifests
 
     raw_versions = _get_subdirectories(sha, _get_path(identifier))
@@ -309,6 +551,7 @@ def _base64_encode(text: str) -> str:
     return b64encode(text.encode()).decode()
 
 
+@traced
 def _create_commit(
     branch_name: str,
     commit_message: str,
@@ -322,7 +565,7 @@ def _create_commit(
         {
             "input": {
                 "branch": {
-                    "repositoryNameWithOwner": f"{OWNER}/{WINGET_PKGS}",
+                    "repositoryNameWithOwner": f"{_get_owner()}/{WINGET_PKGS}",
                     "branchName": branch_name,
                     # id: str
                 },
@@ -342,15 +585,24 @@ def _create_commit(
 
 _owner_repo_id: str | None = None
 _should_delete_fork = True
-
-
-def check_repo_and_delete_merged_branches():
+_is_fork_synced = False
+# bulk.py updates packages concurrently; fork setup and syncing must happen once
+_fork_lock = Lock()
+
+
+@traced
+def check_repo_and_delete_merged_branches(*, is_leader: bool = True, can_delete_fork: bool = True):
+    global _owner_repo_id, _should_delete_fork, _is_fork_synced
+    _owner_repo_id = None
+    _should_delete_fork = True
+    _is_fork_synced = False
+    _generated_manifests.clear()
     repository = _graphql(
         """query GetBranches($owner: String!, $name: String!) { repository(name: $name, owner: $owner) {"""
         """id isEmpty defaultBranchRef { name } refs(first: 100, refPrefix: "refs/heads/") { nodes { name """
         """associatedPullRequests(first: 5) { nodes { title url state repository { nameWithOwner } } }"""
         """} } } }""",
-        {"owner": OWNER, "name": WINGET_PKGS},
+        {"owner": _get_owner(), "name": WINGET_PKGS},
         lambda errors: len(errors) == 1
         and (error := errors[0])["type"] == "NOT_FOUND"
         and error["path"] == ["repository"],
@@ -358,9 +610,15 @@ def check_repo_and_delete_merged_branches():
     if repository is None:
         print("Fork does not exist")
         return
-    global _owner_repo_id
     _owner_repo_id = repository["id"]
 
+    if not is_leader:
+        # other shards only need the fork; the leader cleans it up
+        _should_delete_fork = False
+        if repository["isEmpty"]:
+            _owner_repo_id = None
+        return
+
     if repository["isEmpty"]:
         """This repository is temporarily unavailable.
 
@@ -369,9 +627,14 @@ def check_repo_and_delete_merged_branches():
         Please contact support if the problem persists.
         """
         assert repository["defaultBranchRef"] is None
+        if not can_delete_fork:
+            # other shards may be using it; main.py --finish-shards deletes it after them
+            print("Fork is broken, leaving it to be deleted after every shard has finished")
+            _owner_repo_id = None
+            _should_delete_fork = False
+            return
         print("Fork is broken, deleting it...")
-        delete_fork_if_should()
-        _owner_repo_id = None
+        _delete_fork()
         return
 
     print("Checking for merged branches...")
@@ -385,7 +648,6 @@ def check_repo_and_delete_merged_branches():
         print(f"Branch {ref['name']!r}:")
         if not prs:
             print("[bold red]! There are no PRs associated with this branch[/]")
-            global _should_delete_fork
             _should_delete_fork = False
             continue
         can_delete_branch = True
@@ -426,16 +688,16 @@ def check_repo_and_delete_merged_branches():
         )
 
 
+@traced
 def _create_pr(title: str, branch_name: str) -> str:
     return _rest(
         "POST",
         f"/repos/{MICROSOFT_WINGET_PKGS}/pulls",
         json={
             "title": title,
-            "head": f"{OWNER}:{branch_name}",
-            "body": "Created in " + expandvars(
-                "$GITHUB_SERVER_URL/$GITHUB_REPOSITORY/actions/runs/$GITHUB_RUN_ID"
-            ),
+            "head": f"{_get_owner()}:{branch_name}",
+            "body": "Created in "
+            + expandvars("$GITHUB_SERVER_URL/$GITHUB_REPOSITORY/actions/runs/$GITHUB_RUN_ID"),
             "base": DEFAULT_BRANCH,
         },
     )["html_url"]
@@ -1,9 +1,12 @@
 from collections.abc import Callable, Sequence
 from typing import Protocol
 
-from common import Version, run_komac
-from github import create_fork, get_gh_api, update
-from manifest import Installer, fill_sha256_cache
+import journal
+import state
+from common import Version, run_komac, try_parse_version
+from github import create_fork, get_gh_api, iter_releases, update
+from manifest import Installer, fill_sha256_cache, hash_installers
+from tracing import span
 
 
 class _PackageGetter(Protocol):
@@ -18,59 +21,129 @@ def main(
     moniker: str,
     owner_and_repo: str,
     pre_release: bool = False,
+    catch_up: bool = False,
     transform_release_notes: Callable[[str], str] | None = None,
     use_komac: bool = False,
     with_multiple_packages: _PackageGetter | None = None,
+    release: dict | None = None,
 ):
-    with open(f"{moniker}.txt") as f:
-        old_version = Version(f.read())
+    old_state = state.read(storage := f"{moniker}.txt")
+    old_version = Version(old_state)
 
-    if pre_release:
-        release = get_gh_api(f"/repos/{owner_and_repo}/releases")[0]
+    if release is not None:
+        if release["draft"] or (release["prerelease"] and not pre_release):
+            return
+        releases = [release]
+        is_pushed = True
     else:
-        release = get_gh_api(f"/repos/{owner_and_repo}/releases/latest")
+        with span("get_release"):
+            if catch_up:
+                releases = _get_missed_releases(owner_and_repo, old_version, pre_release)
+            elif pre_release:
+                releases = [get_gh_api(f"/repos/{owner_and_repo}/releases")[0]]
+            else:
+                releases = [get_gh_api(f"/repos/{owner_and_repo}/releases/latest")]
+        is_pushed = False
 
-    fill_sha256_cache(release)
+    if len(releases) > 1 and not use_komac and with_multiple_packages is None:
+        print(f"Catching up on {len(releases)} releases of {owner_and_repo}")
+        _hash_ahead(releases, installers)
 
-    version: str = release["tag_name"].removeprefix("v")
-    if (new_version := Version(version)) == old_version:
-        return
+    # oldest first, each version based on the one before
+    for current in releases:
+        fill_sha256_cache(current)
 
-    assert new_version > old_version
+        version: str = current["tag_name"].removeprefix("v")
+        if (new_version := Version(version)) == old_version:
+            continue
 
-    urls: dict[str, str] = {
-        asset["name"]: asset["browser_download_url"] for asset in release["assets"]
-    }
+        if is_pushed and new_version < old_version:
+            continue  # e.g. a backport release
+        assert new_version > old_version
 
-    for installer in installers:
-        filename = installer["InstallerUrl"].format(version=version)
-        installer["InstallerUrl"] = urls[filename]
+        urls: dict[str, str] = {
+            asset["name"]: asset["browser_download_url"] for asset in current["assets"]
+        }
+        if is_pushed and (
+            not urls
+            or any(
+                installer["InstallerUrl"].format(version=version) not in urls
+                for installer in installers
+            )
+        ):
+            # assets are often uploaded after the release is published; the timer picks it up
+            print(f"Assets of {owner_and_repo} {version} are not uploaded yet")
+            return
+
+        release_installers: list[Installer] = [
+            {**installer, "InstallerUrl": urls[installer["InstallerUrl"].format(version=version)]}
+            for installer in installers
+        ]
 
-    if not use_komac:
-        release_notes: str = release["body"]
-        if transform_release_notes is not None:
-            release_notes = transform_release_notes(release_notes)
+        if not use_komac:
+            release_notes: str = current["body"]
+            if transform_release_notes is not None:
+                with span("transform_release_notes"):
+                    release_notes = transform_release_notes(release_notes)
 
-        if with_multiple_packages is None:
-            packages = {identifier: installers}
+            if with_multiple_packages is None:
+                packages = {identifier: release_installers}
+            else:
+                with span("with_multiple_packages"):
+                    packages = with_multiple_packages(version, urls)
+
+            for package_identifier, package_installers in packages.items():
+                update(
+                    package_identifier,
+                    version,
+                    package_installers,
+                    {
+                        "base_version": f"{old_version}",
+                        "owner_and_repo": owner_and_repo,
+                        "release_notes": {locale: (release_notes, current["html_url"])},
+                        "override_old_installers": bool(with_multiple_packages),
+                        "published_at": current["published_at"],
+                    },
+                )
         else:
-            packages = with_multiple_packages(version, urls)
-
-        for identifier, installers in packages.items():
-            update(
-                identifier,
-                version,
-                installers,
-                {
-                    "base_version": f"{old_version}",
-                    "owner_and_repo": owner_and_repo,
-                    "release_notes": {locale: (release_notes, release["html_url"])},
-                    "override_old_installers": bool(with_multiple_packages),
-                },
+            packages = {}
+            create_fork()
+            run_komac(
+                identifier, version, [installer["InstallerUrl"] for installer in release_installers]
             )
-    else:
-        create_fork()
-        run_komac(identifier, version, [installer["InstallerUrl"] for installer in installers])
 
-    with open(f"{moniker}.txt", "w") as f:
-        f.write(version)
+        state.write(storage, version, expected=old_state)
+        for package_identifier in packages:
+            journal.discard(package_identifier)
+        old_state, old_version = version, new_version
+
+
+def _get_missed_releases(
+    owner_and_repo: str, old_version: Version, pre_release: bool
+) -> list[dict]:
+    # read until the stored version's own release, however many pages back it is
+    missed: list[tuple[Version, dict]] = []
+    for release in iter_releases(owner_and_repo, per_page=100):
+        if (version := try_parse_version(release["tag_name"].removeprefix("v"))) is None:
+            continue
+        if version == old_version:
+            break
+        if version < old_version or release["draft"]:
+            continue
+        if release["prerelease"] and not pre_release:
+            continue
+        missed.append((version, release))
+    return [release for _, release in sorted(missed, key=lambda x: x[0])]
+
+
+def _hash_ahead(releases: list[dict], installers: Sequence[Installer]) -> None:
+    # hashes every missed release's installers concurrently; the updates then reuse the results
+    urls = []
+    for release in releases:
+        fill_sha256_cache(release)
+        version = release["tag_name"].removeprefix("v")
+        assets = {asset["name"]: asset["browser_download_url"] for asset in release["assets"]}
+        for installer in installers:
+            if url := assets.get(installer["InstallerUrl"].format(version=version)):
+                urls.append(url)
+    hash_installers(urls)
@@ -0,0 +1,70 @@
+import json
+import os
+from glob import escape, glob
+from typing import Literal, Required, TypedDict
+
+JOURNAL_DIR = "journal"
+
+# "state persisted" is the final step: the package deletes the entry once its state file is written
+type Step = Literal["detected", "hashed", "branch_created", "committed", "pr_opened"]
+
+
+class Entry(TypedDict, total=False):
+    identifier: Required[str]
+    version: Required[str]
+    step: Required[Step]
+    # the package run that owns the entry, and a hash of the update's installers and args
+    package: str
+    inputs: str
+    published_at: str
+    detected_at: str
+    message: str
+    path: str
+    sha: str
+    manifests: dict[str, str]
+    branch_name: str
+    is_new_branch: bool
+    commit_url: str
+    pr_url: str
+    pr_opened_at: str
+
+
+def _get_path(identifier: str, version: str) -> str:
+    return f"{JOURNAL_DIR}/{identifier}@{version}.json"
+
+
+def load(identifier: str, version: str) -> Entry | None:
+    try:
+        with open(_get_path(identifier, version)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def record(entry: Entry, step: Step) -> None:
+    entry["step"] = step
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    path = _get_path(entry["identifier"], entry["version"])
+    with open(temp := f"{path}.tmp", "w") as f:
+        json.dump(entry, f, indent=1)
+    os.replace(temp, path)
+
+
+def remove(identifier: str, version: str) -> None:
+    try:
+        os.remove(_get_path(identifier, version))
+    except FileNotFoundError:
+        pass
+
+
+def discard(identifier: str) -> None:
+    for path in glob(f"{JOURNAL_DIR}/{escape(identifier)}@*.json"):
+        os.remove(path)
+
+
+def pending() -> list[Entry]:
+    entries = []
+    for path in sorted(glob(f"{JOURNAL_DIR}/*.json")):
+        with open(path) as f:
+            entries.append(json.load(f))
+    return entries
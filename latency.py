@@ -0,0 +1,103 @@
+import json
+import os
+from datetime import datetime
+from glob import glob
+from typing import TypedDict
+
+from journal import Entry
+from metrics import REPORTS_DIR
+
+LATENCY_DIR = "latency"
+
+BUCKETS = (300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 3 * 86400, float("inf"))
+
+# (metric, help, start, end)
+_STAGES = (
+    ("release_to_pr", "upstream publish to pull request", "published_at", "pr_opened_at"),
+    ("release_to_detection", "upstream publish to detection", "published_at", "detected_at"),
+    ("detection_to_pr", "detection to pull request", "detected_at", "pr_opened_at"),
+)
+
+
+class Record(TypedDict, total=False):
+    version: str
+    published_at: str
+    detected_at: str
+    pr_opened_at: str
+
+
+def _get_path(identifier: str) -> str:
+    return f"{LATENCY_DIR}/{identifier}.json"
+
+
+def _load(path: str) -> list[Record]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def record(entry: Entry) -> None:
+    path = _get_path(entry["identifier"])
+    history = [r for r in _load(path) if r["version"] != entry["version"]]
+    new_record: Record = {"version": entry["version"]}
+    for key in ("published_at", "detected_at", "pr_opened_at"):
+        if value := entry.get(key):
+            new_record[key] = value
+    history.append(new_record)
+    os.makedirs(LATENCY_DIR, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(history, f, indent=1)
+
+
+def _get_seconds(r: Record, start: str, end: str) -> float | None:
+    if start in r and end in r:
+        return (datetime.fromisoformat(r[end]) - datetime.fromisoformat(r[start])).total_seconds()
+    return None
+
+
+def _format_textfile(histories: dict[str, list[Record]]) -> str:
+    lines = []
+    for name, description, start, end in _STAGES:
+        metric = f"winget_update_{name}_seconds"
+        lines += [f"# HELP {metric} Time from {description}.", f"# TYPE {metric} histogram"]
+        for identifier, history in histories.items():
+            values = [s for r in history if (s := _get_seconds(r, start, end)) is not None]
+            if not values:
+                continue
+            label = f'identifier="{identifier}"'
+            for bucket in BUCKETS:
+                le = "+Inf" if bucket == float("inf") else f"{bucket}"
+                count = sum(value <= bucket for value in values)
+                lines.append(f'{metric}_bucket{{{label},le="{le}"}} {count}')
+            lines.append(f"{metric}_sum{{{label}}} {sum(values):.3f}")
+            lines.append(f"{metric}_count{{{label}}} {len(values)}")
+
+        metric = f"winget_update_last_{name}_seconds"
+        lines += [
+            f"# HELP {metric} Time from {description} for the latest version.",
+            f"# TYPE {metric} gauge",
+        ]
+        for identifier, history in histories.items():
+            if (value := _get_seconds(history[-1], start, end)) is not None:
+                lines.append(f'{metric}{{identifier="{identifier}"}} {value:.3f}')
+
+    metric = "winget_update_last_pr_timestamp_seconds"
+    lines += [f"# HELP {metric} When the latest pull request was opened.", f"# TYPE {metric} gauge"]
+    for identifier, history in histories.items():
+        if opened_at := history[-1].get("pr_opened_at"):
+            timestamp = datetime.fromisoformat(opened_at).timestamp()
+            lines.append(f'{metric}{{identifier="{identifier}"}} {timestamp:.0f}')
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile() -> None:
+    histories = {
+        os.path.basename(path).removesuffix(".json"): history
+        for path in sorted(glob(f"{LATENCY_DIR}/*.json"))
+        if (history := _load(path))
+    }
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    with open(f"{REPORTS_DIR}/latency.prom", "w") as f:
+        f.write(_format_textfile(histories))
@@ -0,0 +1,26 @@
+import json
+import os
+from typing import Any
+
+# unlike the state files, the cache is not committed: losing it only costs extra requests
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
+
+def _get_path(name: str) -> str:
+    return f"{CACHE_DIR}/{name}.json"
+
+
+def load(name: str) -> Any:
+    try:
+        with open(_get_path(name)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def store(name: str, value: Any) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _get_path(name)
+    with open(temp := f"{path}.tmp", "w") as f:
+        json.dump(value, f, separators=(",", ":"))
+    os.replace(temp, path)
@@ -1,31 +1,140 @@
+import zlib
+from argparse import ArgumentParser
+from collections.abc import Sequence
+from contextlib import nullcontext
+from threading import Thread
+from time import monotonic, sleep
+from traceback import print_exception
+from types import ModuleType
+
 import rich
 
 import discord
 import github
+import latency
+import metrics
 import notepad4
 import oxipng
+import probe
+import profiling
 import ruff
 import scc
 import telegram
+import tracing
 import v2rayn
 import wetype
-from common import CLIENT
+from common import CLIENT, prewarm
+
+PACKAGES = (wetype, telegram, oxipng, scc, ruff, notepad4)
 
 
 def main():
+    parser = ArgumentParser()
+    parser.add_argument("--daemon", action="store_true", help="stay resident and check on a timer")
+    parser.add_argument("--interval", type=float, default=3600, help="seconds between cycles")
+    parser.add_argument("--push", action="store_true", help="commit and push state after cycles")
+    parser.add_argument("--webhook-port", type=int, help="also receive release webhooks")
+    parser.add_argument("--profile", action="store_true", help="profile each package with cProfile")
+    parser.add_argument("--shard-index", type=int, default=0, help="shard to run, 0 is the leader")
+    parser.add_argument("--shard-count", type=int, default=1, help="number of shards")
+    parser.add_argument(
+        "--finish-shards",
+        action="store_true",
+        help="after every shard succeeded, clean up the fork as an unsharded run does",
+    )
+    args = parser.parse_args()
+    if args.profile:
+        profiling.ENABLED = True
+    assert 0 <= args.shard_index < args.shard_count, (args.shard_index, args.shard_count)
+    packages = get_shard(PACKAGES, args.shard_index, args.shard_count)
+    shard = {"is_leader": args.shard_index == 0, "is_sharded": args.shard_count > 1}
+
     rich.reconfigure(force_terminal=True, width=4096)
+    prewarm("https://api.github.com/")
+    try:
+        if args.finish_shards:
+            github.check_repo_and_delete_merged_branches()
+            github.delete_fork_if_should()
+            return
+        if not args.daemon:
+            run(packages, **shard)
+            if args.push:
+                push_state()
+            return
+        lock = nullcontext()
+        if args.webhook_port is not None:
+            import webhook
+
+            server = webhook.serve("0.0.0.0", args.webhook_port, push_state if args.push else None)
+            Thread(target=server.serve_forever, name="webhook-server", daemon=True).start()
+            lock = webhook.LOCK
+        while True:
+            started = monotonic()
+            with lock:
+                try:
+                    run(packages, **shard)
+                except Exception as e:
+                    print_exception(e)
+                if args.push:
+                    try:
+                        push_state()
+                    except Exception as e:
+                        # a failed push is retried with the next cycle's changes
+                        print_exception(e)
+            sleep(max(0, args.interval - (monotonic() - started)))
+    finally:
+        CLIENT.close()
+        metrics.write_report()
+        tracing.write_trace()
+        profiling.write_report()
+        latency.write_textfile()
+
+
+def get_shard(packages: Sequence[ModuleType], index: int, count: int) -> list[ModuleType]:
+    # crc32 rather than hash(), which is salted per process
+    return [mod for mod in packages if zlib.crc32(mod.__name__.encode()) % count == index]
+
+
+def run(
+    packages: Sequence[ModuleType] = PACKAGES, *, is_leader: bool = True, is_sharded: bool = False
+):
+    # shards touch disjoint state and journal files; shared steps on the fork run on the leader
     exceptions = []
-    github.check_repo_and_delete_merged_branches()
-    for mod in (wetype, telegram, oxipng, scc, ruff, notepad4):
+    probe.clear()
+    github.check_repo_and_delete_merged_branches(
+        is_leader=is_leader, can_delete_fork=not is_sharded
+    )
+    for mod in packages:
         try:
-            mod.main()
+            name = mod.__name__
+            with metrics.package(name), tracing.span(name), profiling.package(name):
+                github.resume_pending(name)
+                mod.main()
         except Exception as e:
             exceptions.append(e)
-    if not exceptions:
+    if not exceptions and not is_sharded:
+        # other shards may still be using the fork, so --finish-shards does this after them
         github.delete_fork_if_should()
-    CLIENT.close()
     if exceptions:
         raise ExceptionGroup("Update failed", exceptions)
 
 
-main()
+def push_state():
+    import subprocess
+
+    if not subprocess.run(["git", "status", "--porcelain"], capture_output=True, check=True).stdout:
+        return
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", "Update packages"], check=True)
+    # other shards and the workflow push to the same branch
+    for attempt in range(1, 6):
+        if subprocess.run(["git", "pull", "--rebase"], check=False).returncode != 0:
+            subprocess.run(["git", "rebase", "--abort"], check=False, stderr=subprocess.DEVNULL)
+        elif subprocess.run(["git", "push"], check=False).returncode == 0:
+            return
+        sleep(attempt * 5)
+    raise RuntimeError("Failed to push state")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,41 @@
+import atexit
+import gzip
+import os
 import re
+import sys
 from collections.abc import Sequence
-from datetime import datetime
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import UTC, datetime
 from difflib import unified_diff
 from hashlib import sha256
 from io import StringIO
-from typing import Required, TypedDict
+from threading import Lock
+from typing import TYPE_CHECKING, Required, TypedDict
 
 from rich import print
-from rich.syntax import Syntax
-from ruamel.yaml import YAML, CommentedMap, CommentToken
-from ruamel.yaml.scalarstring import LiteralScalarString
 
+import probe
+import release_notes
 from common import CLIENT, UpdateArgs
+from metrics import REPORTS_DIR
+from tracing import span, traced
+
+if TYPE_CHECKING:
+    from ruamel.yaml import CommentedMap, CommentToken
 
 type Manifests = dict[str, str]
 
+# "plain" writes diffs as they are, "syntax" highlights them; either way each file's diff is
+# cut at DIFF_MAX_LINES on the console and kept whole in reports/diffs
+DIFF_STYLE = os.getenv("DIFF_STYLE", "syntax")
+assert DIFF_STYLE in {"plain", "syntax"}
+DIFF_MAX_LINES = int(os.getenv("DIFF_MAX_LINES", "200"))
+
 sha256_cache: dict[str, str] = {}
 
+_HASH_WORKERS = 4
+
 
 def fill_sha256_cache(release):
     for asset in release["assets"]:
@@ -36,6 +55,7 @@ class Installer(TypedDict, total=False):
     InstallerLocale: str
 
 
+@traced
 def fill_in_release_notes(
     manifests: Manifests, identifier: str, args: UpdateArgs, *, force: bool = False
 ) -> bool:
@@ -59,27 +79,7 @@ def _fill_in_release_notes_by_locale(
     url: str,
     force: bool,
 ) -> bool:
-    notes = notes.strip().replace("\r\n", "\n")
-    notes = re.sub(r"\[([^\]]+?)\]\(\S+?\)", r"\1", notes)  # links
-    notes = re.sub(r"(^|\n)#+ (.+?)\n+", r"\1\2\n", notes)  # headings
-    notes = re.sub(r"(\*{2,})([^*`\n]+?)\1", r"\2", notes)  # italics/bold
-    if owner_and_repo := args.get("owner_and_repo"):
-        notes = re.sub(
-            rf"https://github\.com/{owner_and_repo}/(?:issues|pull|discussions)/(\d+)",
-            r"#\1",
-            notes,
-        )
-        notes = re.sub(
-            r"https://github\.com/([-\w]+)/([-\w]+)/(?:issues|pull|discussions)/(\d+)",
-            r"\1/\2#\3",
-            notes,
-        )
-        notes = re.sub(r"(?:https://github\.com/.+?/commit/)?[0-9a-z]{40}", "", notes)
-    if locale == "zh-CN":
-        from pangu import spacing
-
-        notes = spacing(notes)
-    notes = re.sub(r" +$", "", notes, flags=re.MULTILINE)
+    notes = release_notes.normalize(notes, args.get("owner_and_repo"), locale)
 
     manifest = manifests[f"{identifier}.locale.{locale}.yaml"]
     if args.get("is_url_important") or force:
@@ -102,95 +102,126 @@ def _fill_in_release_notes_by_locale(
     return True
 
 
+@traced
 def update_new_version(
     manifests: Manifests,
     identifier: str,
     version: str,
     new_installers: Sequence[Installer],
     args: UpdateArgs,
-):
-    original = manifests.copy()
-    locales = args.get("release_notes", {}).keys()
-
-    for filename, text in manifests.items():
-        text, newline = _normalize_crlf(text)
-        yaml = _get_yaml()
-        doc: CommentedMap = yaml.load(text)
-
-        if doc.ca.comment:
-            top_comments: list[CommentToken] = doc.ca.comment[1]  # type: ignore
-            assert len(top_comments) <= 2
-            if len(top_comments) == 2:
-                top_comments.pop(0)
-            assert top_comments[0].value.startswith("# yaml-language-server")
-            top_comments[0].value = top_comments[0].value.replace("1.10.0", "1.12.0")
-
-        doc["ManifestVersion"] = doc["ManifestVersion"].replace("1.10.0", "1.12.0")
-        doc["PackageVersion"] = version
-
-        if filename.endswith(".installer.yaml"):
-            installers: list[Installer] = doc["Installers"]
-            if args.get("override_old_installers"):
-                installers[:] = new_installers
-            else:
-                assert len(installers) == len(new_installers)
-                for installer, new_installer in zip(installers, new_installers):
-                    for key, value in new_installer.items():
-                        if key in {"InstallerUrl", "InstallerSha256"}:
-                            continue
-                        assert installer[key] == value, f"{key}: {installer[key]!r} != {value!r}"
-
-            inferred_date = None
-            hashes = {installer["InstallerUrl"]: "" for installer in new_installers}
-            for url in hashes:
-                method = "GET"
-                if url in sha256_cache:
-                    hashes[url] = sha256_cache[url]
-                    method = "HEAD"
-                print(method, url)
-                with CLIENT.stream(method, url) as response:
-                    assert response.is_success
-                    last_modified = datetime.strptime(
-                        response.headers["Last-Modified"], "%a, %d %b %Y %H:%M:%S %Z"
-                    ).date()
-                    if inferred_date is None:
-                        inferred_date = last_modified
-                    else:
-                        inferred_date = min(last_modified, inferred_date)
-
-                    if method == "HEAD":
-                        continue
-                    h = sha256(usedforsecurity=False)
-                    for chunk in response.iter_bytes():
-                        h.update(chunk)
-                hashes[url] = h.hexdigest().upper()
-
-            for installer, new_installer in zip(installers, new_installers):
-                installer["InstallerUrl"] = (url := new_installer["InstallerUrl"])
-                installer["InstallerSha256"] = hashes[url]
-
-            doc["ReleaseDate"] = args.get("release_date", inferred_date)
-        elif ".locale." in filename:
-            if (prefix := args.get("keep_notes_on_version_prefix")) and version.startswith(prefix):
-                pass
-            elif filename.removesuffix(".yaml").partition(".locale.")[2] in locales:
-                pass
-            else:
-                doc.pop("ReleaseNotes", None)  # type: ignore
-                doc.pop("ReleaseNotesUrl", None)  # type: ignore
+) -> datetime | None:
+    from manifest_yaml import Changes, transform
 
-        yaml.dump(doc, s := StringIO(newline=newline))
-        manifests[filename] = s.getvalue()
+    original = manifests.copy()
+    locales = list(args.get("release_notes", {}).keys())
+
+    hashes, earliest_last_modified = _hash_installers(new_installers)
+    changes: Changes = {
+        "version": version,
+        "installers": [
+            {**installer, "InstallerSha256": hashes[installer["InstallerUrl"]]}
+            for installer in new_installers
+        ],
+        "override_old_installers": args.get("override_old_installers", False),
+        "merge_installers_by_architecture": args.get("merge_installers_by_architecture", False),
+        "release_date": args.get(
+            "release_date", earliest_last_modified and earliest_last_modified.date()
+        ),
+        "keep_notes_on_version_prefix": args.get("keep_notes_on_version_prefix"),
+        "locales": locales,
+    }
+
+    filenames = list(manifests)
+    if len(manifests) > 1 and sum(map(len, manifests.values())) >= _POOL_MIN_CHARS:
+        with span("manifest.transform", files=len(manifests), pool=True):
+            texts = _get_pool().map(
+                transform, filenames, manifests.values(), [changes] * len(manifests)
+            )
+            manifests.update(zip(filenames, texts))
+    else:
+        for filename in filenames:
+            with span("manifest.transform", file=filename):
+                manifests[filename] = transform(filename, manifests[filename], changes)
 
     if locales:
         fill_in_release_notes(manifests, identifier, args, force=True)
 
-    _print_manifests_diff(original, manifests)
+    _print_manifests_diff(identifier, version, original, manifests)
+    return earliest_last_modified
+
+
+def _hash_installers(installers: Sequence[Installer]) -> tuple[dict[str, str], datetime | None]:
+    hashed = hash_installers([installer["InstallerUrl"] for installer in installers])
+    hashes = {url: sha for url, (sha, _) in hashed.items()}
+    earliest_last_modified = min(
+        (last_modified for _, last_modified in hashed.values()), default=None
+    )
+    return hashes, earliest_last_modified
+
+
+def hash_installers(urls: Sequence[str]) -> dict[str, tuple[str, datetime]]:
+    urls = list(dict.fromkeys(urls))
+    with span("manifest.hash_installers", count=len(urls)):
+        if len(urls) == 1:
+            return {urls[0]: _hash_installer(urls[0])}
+        with ThreadPoolExecutor(min(len(urls), _HASH_WORKERS), "hash") as executor:
+            futures = [executor.submit(copy_context().run, _hash_installer, url) for url in urls]
+            return {url: future.result() for url, future in zip(urls, futures)}
+
 
+def _hash_installer(url: str) -> tuple[str, datetime]:
+    # cached for the cycle, so installers hashed ahead of an update are not fetched again
+    return probe.cached(f"sha256:{url}", lambda: _fetch_hash(url))
 
-def _print_manifests_diff(original: Manifests, manifests: Manifests) -> None:
+
+def _fetch_hash(url: str) -> tuple[str, datetime]:
+    method = "HEAD" if url in sha256_cache else "GET"
+    print(method, url)
+    with CLIENT.stream(method, url) as response:
+        assert response.is_success
+        last_modified = datetime.strptime(
+            response.headers["Last-Modified"], "%a, %d %b %Y %H:%M:%S %Z"
+        ).replace(tzinfo=UTC)
+        if method == "HEAD":
+            sha = sha256_cache[url]
+        else:
+            h = sha256(usedforsecurity=False)
+            for chunk in response.iter_bytes():
+                h.update(chunk)
+            sha = h.hexdigest().upper()
+    return sha, last_modified
+
+
+# ruamel round-trips roughly 150 KiB/s; below this, starting workers costs more than it saves
+_POOL_MIN_CHARS = 16 * 1024
+
+_pool: Executor | None = None
+_pool_lock = Lock()
+
+
+def _get_pool() -> Executor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # free-threaded builds can parse in threads, otherwise the GIL serializes them
+            if getattr(sys, "_is_gil_enabled", lambda: True)():
+                _pool = ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 8))
+            else:
+                _pool = ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, 8))
+            atexit.register(_pool.shutdown, cancel_futures=True)
+        return _pool
+
+
+@traced
+def _print_manifests_diff(
+    identifier: str, version: str, original: Manifests, manifests: Manifests
+) -> None:
+    path = f"{REPORTS_DIR}/diffs/{identifier}-{version}.diff.gz"
+    diffs = []
     for filename in original:
-        diff = "".join(
+        if original[filename] == manifests[filename]:
+            continue
+        lines = list(
             unified_diff(
                 original[filename].splitlines(True),
                 manifests[filename].splitlines(True),
@@ -198,19 +229,30 @@ def _print_manifests_diff(original: Manifests, manifests: Manifests) -> None:
                 f"{filename} (new)",
             )
         )
-        print(Syntax(diff, "diff"))
-
+        diffs += lines
+        diff = "".join(lines[:DIFF_MAX_LINES])
+        if len(lines) > DIFF_MAX_LINES:
+            diff += f"... {len(lines) - DIFF_MAX_LINES} more lines in {path}\n"
+        if DIFF_STYLE == "plain":
+            sys.stdout.write(diff)
+        else:
+            from rich.syntax import Syntax
 
-def _normalize_crlf(text: str) -> tuple[str, str]:
-    if "\r\n" not in text:
-        return text, "\n"
+            print(Syntax(diff, "diff"))
 
-    assert "\n" not in text.replace("\r\n", "")
-    return text.replace("\r\n", "\n"), "\r\n"
+    if diffs:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+            f.writelines(diffs)
 
 
+@traced
 def _insert_property(text: str, key: str, value: object, *, force: bool = False) -> str | None:
-    text, newline = _normalize_crlf(text)
+    from ruamel.yaml.scalarstring import LiteralScalarString
+
+    from manifest_yaml import get_yaml, normalize_crlf
+
+    text, newline = normalize_crlf(text)
     text, placeholders = re.subn(rf"^# {key}:\s*$", f"{key}: 0", text, flags=re.MULTILINE)
     if placeholders > 1:
         raise RuntimeError("Illegal document")
@@ -218,7 +260,7 @@ def _insert_property(text: str, key: str, value: object, *, force: bool = False)
     if isinstance(value, str) and "\n" in value:
         value = LiteralScalarString(value)
 
-    yaml = _get_yaml()
+    yaml = get_yaml()
     doc: CommentedMap = yaml.load(text)
 
     if placeholders:
@@ -272,10 +314,3 @@ def _insert_property(text: str, key: str, value: object, *, force: bool = False)
 
     yaml.dump(doc, s := StringIO(newline=newline))
     return s.getvalue()
-
-
-def _get_yaml() -> YAML:
-    yaml = YAML()
-    yaml.preserve_quotes = True
-    yaml.width = 4096
-    return yaml
@@ -0,0 +1,101 @@
+from copy import deepcopy
+from datetime import date
+from io import StringIO
+from typing import TYPE_CHECKING, TypedDict
+
+from ruamel.yaml import YAML, CommentedMap, CommentToken
+
+if TYPE_CHECKING:
+    from manifest import Installer
+
+# only ruamel.yaml and the standard library are imported here, so worker processes
+# start quickly; everything a transformation needs is passed in as plain data
+
+
+class Changes(TypedDict):
+    version: str
+    installers: "list[Installer]"
+    override_old_installers: bool
+    merge_installers_by_architecture: bool
+    release_date: date | None
+    keep_notes_on_version_prefix: str | None
+    locales: list[str]
+
+
+def transform(filename: str, text: str, changes: Changes) -> str:
+    text, newline = normalize_crlf(text)
+    yaml = get_yaml()
+    doc: CommentedMap = yaml.load(text)
+
+    if doc.ca.comment:
+        top_comments: list[CommentToken] = doc.ca.comment[1]  # type: ignore
+        assert len(top_comments) <= 2
+        if len(top_comments) == 2:
+            top_comments.pop(0)
+        assert top_comments[0].value.startswith("# yaml-language-server")
+        top_comments[0].value = top_comments[0].value.replace("1.10.0", "1.12.0")
+
+    doc["ManifestVersion"] = doc["ManifestVersion"].replace("1.10.0", "1.12.0")
+    doc["PackageVersion"] = (version := changes["version"])
+
+    if filename.endswith(".installer.yaml"):
+        installers: list[Installer] = doc["Installers"]
+        new_installers = changes["installers"]
+        if changes["override_old_installers"]:
+            installers[:] = new_installers
+        elif changes["merge_installers_by_architecture"]:
+            installers[:] = [
+                _update_installer(_get_base_installer(installers, new_installer), new_installer)
+                for new_installer in new_installers
+            ]
+        else:
+            assert len(installers) == len(new_installers)
+            for installer, new_installer in zip(installers, new_installers):
+                _update_installer(installer, new_installer)
+        doc["ReleaseDate"] = changes["release_date"]
+    elif ".locale." in filename:
+        if (prefix := changes["keep_notes_on_version_prefix"]) and version.startswith(prefix):
+            pass
+        elif filename.removesuffix(".yaml").partition(".locale.")[2] in changes["locales"]:
+            pass
+        else:
+            doc.pop("ReleaseNotes", None)  # type: ignore
+            doc.pop("ReleaseNotesUrl", None)  # type: ignore
+
+    yaml.dump(doc, s := StringIO(newline=newline))
+    return s.getvalue()
+
+
+def _get_base_installer(installers: "list[Installer]", new_installer: "Installer") -> "Installer":
+    # the installer of the same architecture; a sole installer is the template for another one
+    arch = new_installer["Architecture"]
+    matches = [installer for installer in installers if installer["Architecture"] == arch]
+    assert len(matches) == 1 or (not matches and len(installers) == 1), (arch, installers)
+    installer = deepcopy(matches[0] if matches else installers[0])
+    installer["Architecture"] = arch
+    return installer
+
+
+def _update_installer(installer: "Installer", new_installer: "Installer") -> "Installer":
+    for key, value in new_installer.items():
+        if key in {"InstallerUrl", "InstallerSha256"}:
+            continue
+        assert installer[key] == value, f"{key}: {installer[key]!r} != {value!r}"
+    installer["InstallerUrl"] = new_installer["InstallerUrl"]
+    installer["InstallerSha256"] = new_installer["InstallerSha256"]
+    return installer
+
+
+def normalize_crlf(text: str) -> tuple[str, str]:
+    if "\r\n" not in text:
+        return text, "\n"
+
+    assert "\n" not in text.replace("\r\n", "")
+    return text.replace("\r\n", "\n"), "\r\n"
+
+
+def get_yaml() -> YAML:
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    yaml.width = 4096
+    return yaml
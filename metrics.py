@@ -0,0 +1,248 @@
+import json
+import os
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import partial
+from threading import Lock
+from time import perf_counter
+
+import httpx
+
+REPORTS_DIR = os.getenv("REPORTS_DIR", "reports")
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf"))
+
+PACKAGE: ContextVar[str] = ContextVar("package", default="main")
+
+_OPERATION_REGEX = re.compile(rb"(?:query|mutation) (\w+)")
+_RATE_LIMIT_HEADERS = ("limit", "remaining", "used", "reset")
+
+
+@dataclass
+class _Stats:
+    count: int = 0
+    retries: int = 0
+    bytes: int = 0
+    seconds: float = 0
+    max_seconds: float = 0
+    statuses: Counter[int] = field(default_factory=Counter)
+    histogram: list[int] = field(default_factory=lambda: [0] * len(BUCKETS))
+
+
+@dataclass
+class _Pool:
+    requests: int = 0
+    connections: int = 0
+    connect_seconds: float = 0
+    wait_seconds: float = 0
+    max_wait_seconds: float = 0
+    http_versions: Counter[str] = field(default_factory=Counter)
+
+
+_lock = Lock()
+_stats: dict[tuple[str, str, str], _Stats] = defaultdict(_Stats)
+_pools: dict[str, _Pool] = defaultdict(_Pool)
+_package_seconds: Counter[str] = Counter()
+_rate_limits: dict[str, dict[str, int]] = {}
+
+
+def _get_endpoint(request: httpx.Request) -> str:
+    parts = request.url.path.split("/")
+    host = request.url.host
+    if (host == "api.github.com" and parts[1:2] == ["repos"]) or (
+        host == "github.com" and "releases" in parts
+    ):
+        start = 2 if host == "api.github.com" else 1
+        parts[start : start + 2] = ["{owner}", "{repo}"]
+    parts = [
+        "{}" if not part.startswith("{") and any(c.isdigit() for c in part) else part
+        for part in parts
+    ]
+    endpoint = f"{request.method} {'/'.join(parts)}"
+    if request.url.path == "/graphql" and (match := _OPERATION_REGEX.search(request.content)):
+        endpoint += f" {match.group(1).decode()}"
+    return endpoint
+
+
+def _get_key(request: httpx.Request) -> tuple[str, str, str]:
+    return PACKAGE.get(), request.url.host, _get_endpoint(request)
+
+
+def on_request(request: httpx.Request) -> None:
+    request.extensions["metrics_started"] = started = perf_counter()
+    request.extensions["trace"] = partial(_on_trace, request.url.host, started, {})
+
+
+def _on_trace(host: str, started: float, timings: dict[str, float], event: str, _: dict) -> None:
+    # httpcore events: time spent connecting, and waiting for a free connection in the pool
+    now = perf_counter()
+    if event == "connection.connect_tcp.started":
+        timings["connect"] = now
+    elif event in {"connection.connect_tcp.complete", "connection.start_tls.complete"}:
+        timings["connected"] = now
+    elif event.endswith(".send_request_headers.started"):
+        connect_seconds = timings["connected"] - timings["connect"] if timings else 0
+        wait_seconds = now - started - connect_seconds
+        with _lock:
+            pool = _pools[host]
+            if timings:
+                pool.connections += 1
+                pool.connect_seconds += connect_seconds
+            pool.wait_seconds += wait_seconds
+            pool.max_wait_seconds = max(pool.max_wait_seconds, wait_seconds)
+
+
+def on_response(response: httpx.Response) -> None:
+    request = response.request
+    elapsed = perf_counter() - request.extensions["metrics_started"]
+    with _lock:
+        stats = _stats[_get_key(request)]
+        stats.count += 1
+        stats.seconds += elapsed
+        stats.max_seconds = max(stats.max_seconds, elapsed)
+        stats.statuses[response.status_code] += 1
+        stats.histogram[bisect_left(BUCKETS, elapsed)] += 1
+        pool = _pools[request.url.host]
+        pool.requests += 1
+        pool.http_versions[response.http_version] += 1
+        if request.method != "HEAD":
+            stats.bytes += int(response.headers.get("Content-Length", 0))
+        if resource := response.headers.get("X-RateLimit-Resource"):
+            _rate_limits[resource] = {
+                key: int(value)
+                for key in _RATE_LIMIT_HEADERS
+                if (value := response.headers.get(f"X-RateLimit-{key}"))
+            }
+
+
+def on_body(response: httpx.Response) -> None:
+    # bodies without Content-Length (chunked, compressed) are only known once read
+    if "Content-Length" not in response.headers and response.request.method != "HEAD":
+        with _lock:
+            _stats[_get_key(response.request)].bytes += response.num_bytes_downloaded
+
+
+def on_retry(method: str, url: str) -> None:
+    with _lock:
+        _stats[_get_key(httpx.Request(method, url))].retries += 1
+
+
+@contextmanager
+def package(name: str) -> Iterator[None]:
+    token = PACKAGE.set(name)
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        _package_seconds[name] += perf_counter() - started
+        PACKAGE.reset(token)
+
+
+def get_report() -> dict:
+    packages: dict[str, dict] = defaultdict(
+        lambda: {"seconds": 0, "requests": 0, "github_requests": 0, "bytes": 0}
+    )
+    endpoints = []
+    for (name, host, endpoint), stats in sorted(_stats.items()):
+        summary = packages[name]
+        summary["requests"] += stats.count
+        summary["bytes"] += stats.bytes
+        if host == "api.github.com":
+            summary["github_requests"] += stats.count
+        endpoints.append({
+            "package": name,
+            "host": host,
+            "endpoint": endpoint,
+            "count": stats.count,
+            "retries": stats.retries,
+            "bytes": stats.bytes,
+            "seconds": round(stats.seconds, 3),
+            "max_seconds": round(stats.max_seconds, 3),
+            "statuses": dict(stats.statuses),
+            "histogram": dict(zip(map(str, BUCKETS), stats.histogram)),
+        })
+    for name, seconds in _package_seconds.items():
+        packages[name]["seconds"] = round(seconds, 3)
+    pools = {
+        host: {
+            "requests": pool.requests,
+            "connections": pool.connections,
+            "connect_seconds": round(pool.connect_seconds, 3),
+            "wait_seconds": round(pool.wait_seconds, 3),
+            "max_wait_seconds": round(pool.max_wait_seconds, 3),
+            "http_versions": dict(pool.http_versions),
+        }
+        for host, pool in sorted(_pools.items())
+    }
+    return {
+        "packages": packages,
+        "endpoints": endpoints,
+        "pools": pools,
+        "rate_limits": _rate_limits,
+    }
+
+
+def _format_markdown(report: dict) -> str:
+    lines = [
+        "### HTTP cost per package",
+        "",
+        "| Package | Time (s) | Requests | GitHub API | Downloaded (MiB) |",
+        "| --- | ---: | ---: | ---: | ---: |",
+    ]
+    for name, summary in sorted(report["packages"].items(), key=lambda x: -x[1]["seconds"]):
+        lines.append(
+            f"| {name} | {summary['seconds']:.1f} | {summary['requests']} |"
+            f" {summary['github_requests']} | {summary['bytes'] / 2**20:.1f} |"
+        )
+    lines += [
+        "",
+        "### Slowest endpoints",
+        "",
+        "| Package | Endpoint | Count | Retries | Total (s) | Max (s) |",
+        "| --- | --- | ---: | ---: | ---: | ---: |",
+    ]
+    for e in sorted(report["endpoints"], key=lambda e: -e["seconds"])[:20]:
+        lines.append(
+            f"| {e['package']} | `{e['host']}` `{e['endpoint']}` | {e['count']} | {e['retries']} |"
+            f" {e['seconds']:.2f} | {e['max_seconds']:.2f} |"
+        )
+    lines += [
+        "",
+        "### Connections per host",
+        "",
+        "| Host | Requests | Connections | Connect (s) | Pool wait (s) | Max wait (s) | Protocol |",
+        "| --- | ---: | ---: | ---: | ---: | ---: | --- |",
+    ]
+    for host, pool in sorted(report["pools"].items(), key=lambda x: -x[1]["requests"]):
+        lines.append(
+            f"| `{host}` | {pool['requests']} | {pool['connections']} |"
+            f" {pool['connect_seconds']:.2f} | {pool['wait_seconds']:.2f} |"
+            f" {pool['max_wait_seconds']:.2f} | {', '.join(pool['http_versions'])} |"
+        )
+    if rate_limits := report["rate_limits"]:
+        lines += ["", "### Rate limits", "", "| Resource | Used | Remaining | Limit |"]
+        lines.append("| --- | ---: | ---: | ---: |")
+        for resource, limit in sorted(rate_limits.items()):
+            lines.append(
+                f"| {resource} | {limit.get('used')} | {limit.get('remaining')} |"
+                f" {limit.get('limit')} |"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def write_report() -> None:
+    report = get_report()
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    with open(f"{REPORTS_DIR}/metrics.json", "w") as f:
+        json.dump(report, f, indent=1)
+    markdown = _format_markdown(report)
+    with open(f"{REPORTS_DIR}/metrics.md", "w") as f:
+        f.write(markdown)
+    if summary := os.getenv("GITHUB_STEP_SUMMARY"):
+        with open(summary, "a") as f:
+            f.write(markdown)
@@ -2,9 +2,12 @@ import re
 from collections.abc import Sequence
 
 from manifest import Installer
+from release_notes import Rules
 
+OWNER_AND_REPO = "zufuliu/notepad4"
 
-def main():
+
+def main(release: dict | None = None):
     from github_releases import main
 
     main(
@@ -12,15 +15,20 @@ def main():
         installers=(),
         locale="en-US",
         moniker=__name__,
-        owner_and_repo="zufuliu/notepad4",
-        transform_release_notes=_transform,
+        owner_and_repo=OWNER_AND_REPO,
+        release=release,
+        transform_release_notes=_RULES,
         with_multiple_packages=_get_packages,
     )
 
 
 def _get_packages(version: str, urls: dict[str, str]) -> dict[str, Sequence[Installer]]:
     version = f"v{version}"
-    urls = {file: url for file, url in urls.items() if not file.startswith("FindInFiles-") and "AVX512" not in file}
+    urls = {
+        file: url
+        for file, url in urls.items()
+        if not file.startswith("FindInFiles-") and "AVX512" not in file
+    }
 
     installers: list[Installer] = []
     installers_avx2: list[Installer] = []
@@ -64,11 +72,13 @@ def _get_packages(version: str, urls: dict[str, str]) -> dict[str, Sequence[Inst
     return {"zufuliu.notepad4": installers, "zufuliu.notepad4.AVX2": installers_avx2}
 
 
-def _transform(release_notes: str) -> str:
-    _, release_notes = re.split(r"#+ Changes Since .+", release_notes)
-    release_notes = re.sub(r"#+ File List.+", "", release_notes, flags=re.DOTALL)
-    release_notes = re.sub(r"[,:]? ?[0-9a-f]{40}(?: and|, etc\.?)?", "", release_notes)  # SHA
-    release_notes = re.sub(r"(?<!\.)\.\.(?=\s|$)", ".", release_notes, flags=re.MULTILINE)  # . SHA.
-    release_notes = release_notes.replace(" ()", "")  # (SHA)
-    release_notes = re.sub(r"</?kbd>", "`", release_notes)
-    return release_notes
+_RULES = Rules(
+    after="Changes Since ",
+    footers=("File List",),
+    substitutions=(
+        (r"[,:]? ?[0-9a-f]{40}(?: and|, etc\.?)?", ""),  # SHA
+        (r"(?<!\.)\.\.(?=\s|$)", "."),  # . SHA.
+        (r" \(\)", ""),  # (SHA)
+        (r"</?kbd>", "`"),
+    ),
+)
@@ -1,7 +1,9 @@
 import github_releases
 
+OWNER_AND_REPO = "shssoichiro/oxipng"
 
-def main():
+
+def main(release: dict | None = None):
     github_releases.main(
         identifier="Shssoichiro.Oxipng",
         installers=[
@@ -10,6 +12,7 @@ def main():
         ],
         locale="en-US",
         moniker=__name__,
-        owner_and_repo="shssoichiro/oxipng",
+        owner_and_repo=OWNER_AND_REPO,
+        release=release,
         use_komac=True,
     )
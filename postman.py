@@ -1,14 +1,19 @@
 import json
+from functools import partial
 
+import probe
+import state
 from common import VERSION_REGEX, Version, get, run_komac
 
 
 def main():
-    with open("postman.txt") as f:
-        old_version = Version(f.read())
+    old_version = Version(old_state := state.read("postman.txt"))
 
-    assert (version_1 := get_version_1(old_version)) >= old_version
-    assert (version_2 := get_version_2(old_version)) >= old_version
+    versions = probe.run({
+        "update": partial(get_version_1, old_version),
+        "status": partial(get_version_2, old_version),
+    })
+    version_1, version_2 = probe.at_least(versions, old_version).values()
 
     print(f"Postman:\n{old_version=}\n{version_1=}\n{version_2=}")
 
@@ -19,8 +24,7 @@ def main():
             f"https://dl.pstmn.io/download/version/${version_1}/win64",
         )
 
-    with open("postman.txt", "w") as f:
-        f.write(str(max(version_1, version_2)))
+    state.write("postman.txt", str(max(version_1, version_2)), expected=old_state)
 
 
 def get_version_1(old_version: Version) -> Version:
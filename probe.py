@@ -0,0 +1,81 @@
+from collections.abc import Callable, Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from threading import Lock
+from typing import Any
+
+import metrics
+from tracing import span
+
+MAX_WORKERS = 8
+
+_lock = Lock()
+_executor: ThreadPoolExecutor | None = None
+_cache: dict[str, Future] = {}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(MAX_WORKERS, "probe")
+        return _executor
+
+
+def cached[T](name: str, fn: Callable[[], T]) -> T:
+    # keyed per package, so one cycle fetches each endpoint once however many probes read it
+    key = f"{metrics.PACKAGE.get()}:{name}"
+    with _lock:
+        if is_new := (future := _cache.get(key)) is None:
+            future = _cache[key] = Future()
+    if is_new:
+        try:
+            with span("probe", key=key):
+                future.set_result(fn())
+        except BaseException as e:
+            # waiting callers share the failure, later ones try again
+            with _lock:
+                del _cache[key]
+            future.set_exception(e)
+    return future.result()
+
+
+def run[T](probes: Mapping[str, Callable[[], T]]) -> dict[str, T]:
+    if len(probes) == 1:
+        [(name, fn)] = probes.items()
+        return {name: cached(name, fn)}
+    executor = _get_executor()
+    futures = {
+        name: executor.submit(copy_context().run, cached, name, fn) for name, fn in probes.items()
+    }
+    results: dict[str, T] = {}
+    exceptions = []
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            e.add_note(f"probe: {name}")
+            exceptions.append(e)
+    if exceptions:
+        raise ExceptionGroup("Probes failed", exceptions)
+    return results
+
+
+def at_least[T: Any](results: Mapping[str, T], minimum: T) -> dict[str, T]:
+    for name, value in results.items():
+        assert value >= minimum, f"{name}: {value} < {minimum}"
+    return dict(results)
+
+
+def agree[T](results: Mapping[str, T], *names: str) -> T:
+    assert len(values := {results[name] for name in names or results}) == 1, results
+    return values.pop()
+
+
+def clear(package: str | None = None) -> None:
+    with _lock:
+        if package is None:
+            _cache.clear()
+            return
+        for key in [key for key in _cache if key.startswith(f"{package}:")]:
+            del _cache[key]
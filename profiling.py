@@ -0,0 +1,40 @@
+import cProfile
+import os
+import pstats
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from metrics import REPORTS_DIR
+
+ENABLED = os.getenv("PROFILE", "").lower() not in ("", "0", "false")
+TOP = int(os.getenv("PROFILE_TOP", "30"))
+
+_profilers: dict[str, cProfile.Profile] = {}
+
+
+@contextmanager
+def package(name: str) -> Iterator[None]:
+    if not ENABLED:
+        yield
+        return
+    # cProfile only sees the calling thread; work handed to other threads is not included
+    profiler = _profilers.setdefault(name, cProfile.Profile())
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+
+
+def write_report() -> None:
+    if not _profilers:
+        return
+    os.makedirs(f"{REPORTS_DIR}/profiles", exist_ok=True)
+    paths = []
+    for name, profiler in _profilers.items():
+        profiler.dump_stats(path := f"{REPORTS_DIR}/profiles/{name}.prof")
+        paths.append(path)
+    with open(f"{REPORTS_DIR}/profile.txt", "w") as f:
+        stats = pstats.Stats(*paths, stream=f).strip_dirs()
+        for key in ("tottime", "cumulative"):
+            stats.sort_stats(key).print_stats(TOP)
@@ -0,0 +1,81 @@
+import re
+from collections.abc import Sequence
+from functools import lru_cache, partial
+
+# every pattern stays within one line and its character classes exclude their own delimiters,
+# so a failed match attempt ends at the next delimiter instead of rescanning the rest of the notes
+_HEADING = re.compile(r"(^|\n)#+ (.+?)\n+")
+_INLINE = re.compile(
+    r"\[(?P<link>[^\[\]\n]+)\]\(\S[^\s)]*\)"
+    # a run of stars is taken whole even when it doesn't open bold text, so it's scanned once
+    r"|(?P<stars>\*{2,}+)(?:(?P<bold>[^*`\n]++)(?P=stars))?"
+    r"|https://github\.com/(?P<owner>[-\w]+)/(?P<repo>[-\w]+)/(?:issues|pull|discussions)/(?P<number>\d+)"
+    r"|(?P<commit>(?:https://github\.com/[^\s/]+/[^\s/]+/commit/)?[0-9a-z]{40})"
+)
+_TRAILING_SPACES = re.compile(r" +$", re.MULTILINE)
+
+
+class Rules:
+    """Per-package release notes clean-up, compiled once and applied in this order:
+
+    - `after`: heading that must appear exactly once; everything up to the end of its line is dropped
+    - `title`: heading the notes start with, dropped up to the end of its line
+    - `footers`: headings where the notes end, the earliest one wins
+    - `substitutions`: `(pattern, replacement)` pairs applied in order with `re.MULTILINE`
+    """
+
+    def __init__(
+        self,
+        *,
+        after: str | None = None,
+        title: str | None = None,
+        footers: Sequence[str] = (),
+        substitutions: Sequence[tuple[str, str]] = (),
+    ) -> None:
+        self.after = after and re.compile(rf"#+ {re.escape(after)}.+")
+        self.title = title and re.compile(rf"#+ {re.escape(title)}.*")
+        self.footers = footers and re.compile(rf"#+ (?:{'|'.join(map(re.escape, footers))})")
+        self.substitutions = [
+            (re.compile(pattern, re.MULTILINE), replacement)
+            for pattern, replacement in substitutions
+        ]
+
+    def __call__(self, notes: str) -> str:
+        return _apply(self, notes)
+
+
+@lru_cache(maxsize=64)
+def _apply(rules: Rules, notes: str) -> str:
+    if rules.after:
+        _, notes = rules.after.split(notes)
+    if rules.title and (match := rules.title.match(notes)):
+        notes = notes[match.end() :]
+    if rules.footers and (match := rules.footers.search(notes)):
+        notes = notes[: match.start()]
+    for pattern, replacement in rules.substitutions:
+        notes = pattern.sub(replacement, notes)
+    return notes
+
+
+def _replace(owner_and_repo: str | None, match: re.Match[str]) -> str:
+    if (text := match["link"] or match["bold"]) is not None:
+        return _INLINE.sub(partial(_replace, owner_and_repo), text)
+    if not owner_and_repo or match["stars"]:
+        return match[0]
+    if match["commit"]:
+        return ""
+    if f"{match['owner']}/{match['repo']}" == owner_and_repo:
+        return f"#{match['number']}"
+    return f"{match['owner']}/{match['repo']}#{match['number']}"
+
+
+@lru_cache(maxsize=64)
+def normalize(notes: str, owner_and_repo: str | None, locale: str) -> str:
+    notes = notes.strip().replace("\r\n", "\n")
+    notes = _HEADING.sub(r"\1\2\n", notes)
+    notes = _INLINE.sub(partial(_replace, owner_and_repo), notes)
+    if locale == "zh-CN":
+        from pangu import spacing
+
+        notes = spacing(notes)
+    return _TRAILING_SPACES.sub("", notes)
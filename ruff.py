@@ -1,17 +1,19 @@
-import re
-
 import github_releases
+from release_notes import Rules
+
+OWNER_AND_REPO = "astral-sh/ruff"
 
+_RULES = Rules(
+    title="Release Notes",
+    footers=("Contributors", "Install ruff "),
+    substitutions=(
+        (r"\\\[`(.+?)`\\\]", r"[\1]"),  # \[`module`\]
+        (r"`([A-Z]+\d+)`", r"\1"),  # rules
+    ),
+)
 
-def main():
-    def transform(release_notes: str) -> str:
-        release_notes = re.sub(r"^#+ Release Notes.*", "", release_notes)
-        release_notes = re.sub(r"#+ Contributors.+", "", release_notes, flags=re.DOTALL)
-        release_notes = re.sub(r"#+ Install ruff .+", "", release_notes, flags=re.DOTALL)
-        release_notes = re.sub(r"\\\[`(.+?)`\\\]", r"[\1]", release_notes)  # \[`module`\]
-        release_notes = re.sub(r"`([A-Z]+\d+)`", r"\1", release_notes)  # rules
-        return release_notes
 
+def main(release: dict | None = None):
     github_releases.main(
         identifier="astral-sh.ruff",
         installers=[
@@ -21,6 +23,9 @@ def main():
         ],
         locale="en-US",
         moniker=__name__,
-        owner_and_repo="astral-sh/ruff",
-        transform_release_notes=transform,
+        owner_and_repo=OWNER_AND_REPO,
+        # patch releases often follow each other within the hour
+        catch_up=True,
+        release=release,
+        transform_release_notes=_RULES,
     )
@@ -1,14 +1,12 @@
-import re
-
 import github_releases
+from release_notes import Rules
+
+OWNER_AND_REPO = "boyter/scc"
 
+_RULES = Rules(title="Release", footers=("Changelog",))
 
-def main():
-    def transform(release_notes: str) -> str:
-        release_notes = re.sub(r"^#+ Release.*", "", release_notes)
-        release_notes = re.sub(r"#+ Changelog.+", "", release_notes, flags=re.DOTALL)
-        return release_notes
 
+def main(release: dict | None = None):
     github_releases.main(
         identifier="BenBoyter.scc",
         installers=[
@@ -18,6 +16,7 @@ def main():
         ],
         locale="en-US",
         moniker=__name__,
-        owner_and_repo="boyter/scc",
-        transform_release_notes=transform,
+        owner_and_repo=OWNER_AND_REPO,
+        release=release,
+        transform_release_notes=_RULES,
     )
@@ -0,0 +1,127 @@
+import os
+from argparse import ArgumentParser
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import Lock
+from typing import TYPE_CHECKING
+
+from local_cache import CACHE_DIR
+
+if TYPE_CHECKING:
+    import sqlite3
+
+# a cache local to the runner that serializes writers across its threads and processes; the
+# committed state files next to the scripts are the source of truth (and git log their history),
+# so they are imported when they were edited or pulled and exported once a write is committed
+STATE_DB = os.getenv("STATE_DB", f"{CACHE_DIR}/state.db")
+
+_SCHEMA_VERSION = 2
+# `exported` is the value last written to the file, a file that differs from it is newer
+_SCHEMA = """
+DROP TABLE IF EXISTS state;
+DROP TABLE IF EXISTS history;
+CREATE TABLE state (name TEXT PRIMARY KEY, value TEXT NOT NULL, exported TEXT);
+"""
+
+_lock = Lock()
+_connection: "sqlite3.Connection | None" = None
+
+
+def _connect() -> "sqlite3.Connection":
+    global _connection
+    if _connection is None:
+        import sqlite3
+
+        os.makedirs(os.path.dirname(STATE_DB) or ".", exist_ok=True)
+        connection = sqlite3.connect(
+            STATE_DB, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        with _transaction(connection):
+            if connection.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                for statement in filter(str.strip, _SCHEMA.split(";")):
+                    connection.execute(statement)
+                connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        _connection = connection
+    return _connection
+
+
+@contextmanager
+def _transaction(connection: "sqlite3.Connection") -> Iterator[None]:
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+
+
+def _read_file(name: str) -> str | None:
+    try:
+        with open(name) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _export(connection: "sqlite3.Connection", name: str, value: str) -> None:
+    # only while the value is still the latest, so a slower writer can't overwrite a newer file
+    with _transaction(connection):
+        if connection.execute(
+            "SELECT 1 FROM state WHERE name = ? AND value = ?", (name, value)
+        ).fetchone():
+            with open(temp := f"{name}.tmp", "w") as f:
+                f.write(value)
+            os.replace(temp, name)
+            connection.execute("UPDATE state SET exported = value WHERE name = ?", (name,))
+
+
+def read(name: str) -> str:
+    with _lock:
+        connection = _connect()
+        with _transaction(connection):
+            row = connection.execute(
+                "SELECT value, exported FROM state WHERE name = ?", (name,)
+            ).fetchone()
+            # a missing row (first run, lost cache) or an edited/pulled file: the file wins
+            if (file_value := _read_file(name)) is not None and (not row or row[1] != file_value):
+                connection.execute(
+                    "INSERT INTO state VALUES (?1, ?2, ?2) ON CONFLICT (name)"
+                    " DO UPDATE SET value = excluded.value, exported = excluded.exported",
+                    (name, file_value),
+                )
+                row = (file_value,)
+    assert row, f"no state for {name}"
+    return row[0]
+
+
+def write(name: str, value: str, *, expected: str) -> None:
+    # compare-and-swap: fails if another run changed the state since it was read
+    with _lock:
+        connection = _connect()
+        with _transaction(connection):
+            row = connection.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+            if (row[0] if row else None) != expected:
+                raise RuntimeError(f"{name} changed from {expected!r} to {row and row[0]!r}")
+            connection.execute("UPDATE state SET value = ? WHERE name = ?", (value, name))
+        _export(connection, name, value)
+
+
+def export() -> list[str]:
+    with _lock:
+        connection = _connect()
+        rows = connection.execute("SELECT name, value FROM state ORDER BY name").fetchall()
+        for name, value in rows:
+            _export(connection, name, value)
+    return [name for name, _ in rows]
+
+
+def main():
+    ArgumentParser(description="Rewrite every state file from the database").parse_args()
+    for name in export():
+        print(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,24 @@
 import json
-from typing import override
+from functools import cached_property, partial
+from time import time
+from typing import ClassVar, override
 
+import local_cache
+import probe
 from common import UpdateArgs, Version, get, retry_request
-from github import get_gh_api
+from github import get_release_by_tag, iter_releases
 from manifest import Installer, fill_sha256_cache
-from with_release_notes import WithReleaseNotes
+from with_release_notes import FRESH_FOR_ONE_RUN, RUN_INTERVAL, Hook, WithReleaseNotes
+
+
+# over before the next scheduled run, which re-probes whenever get_memo isn't fresh; runs close
+# together (webhook, manual or daemon) don't repeat the probes. The URLs contain the version, so a
+# new version is always probed
+MISSING_TTL = RUN_INTERVAL // 2
+
+_OWNER_AND_REPO = "telegramdesktop/tdesktop"
+_CHANNELS = ("win64", "win", "winarm")
+_MISSING_CACHE = "telegram-missing"
 
 
 def main():
@@ -47,50 +61,55 @@ def _get_installers(new_version: str, is_arm_updated: bool, github_release: dict
                 "InstallerSha256": "",
             })
 
-    def replace_with_github_release(installers: list[Installer], github_release):
-        # from github_releases.py
-        urls: dict[str, str] = {
-            asset["name"]: asset["browser_download_url"] for asset in github_release["assets"]
-        }
-        mapped = [
-            urls.get(installer["InstallerUrl"].rpartition("/")[-1]) for installer in installers
-        ]
-        if all(mapped):
-            fill_sha256_cache(github_release)
-            for installer, url in zip(installers, mapped):
-                assert url
-                installer["InstallerUrl"] = url
-            return True
-        return False
-
-    if github_release and replace_with_github_release(installers, github_release):
-        return installers
+    # from github_releases.py, the listing already tells which assets exist
+    urls: dict[str, str] = {}
+    if github_release:
+        urls = {asset["name"]: asset["browser_download_url"] for asset in github_release["assets"]}
 
-    def verify_arm_installers(installers: list[Installer]) -> bool:
-        for installer in installers:
-            if installer.get("Architecture") != "arm64":
-                continue
-            if not (response := retry_request("HEAD", installer["InstallerUrl"])).is_success:
-                assert response.status_code == 404
-                return False
-        return True
+    def is_on_github(installers: list[Installer]) -> bool:
+        return all(
+            installer["InstallerUrl"].rpartition("/")[-1] in urls for installer in installers
+        )
 
-    if is_arm_updated or verify_arm_installers(installers):
-        return installers
+    if not (is_on_github(installers) or is_arm_updated or _are_available(installers, "arm64")):
+        installers = [i for i in installers if i.get("Architecture") != "arm64"]
 
-    installers = [installer for installer in installers if installer.get("Architecture") != "arm64"]
+    if github_release and is_on_github(installers):
+        fill_sha256_cache(github_release)
+        for installer in installers:
+            installer["InstallerUrl"] = urls[installer["InstallerUrl"].rpartition("/")[-1]]
+    return installers
 
-    if github_release and replace_with_github_release(installers, github_release):
-        return installers
 
-    return installers
+def _is_available(url: str) -> bool:
+    if (response := retry_request("HEAD", url)).is_success:
+        return True
+    assert response.status_code == 404
+    return False
+
+
+def _are_available(installers: list[Installer], arch: str) -> bool:
+    # installers that were missing recently are assumed to still be missing until the TTL ends
+    now = time()
+    missing: dict[str, float] = {
+        url: expires_at
+        for url, expires_at in (local_cache.load(_MISSING_CACHE) or {}).items()
+        if expires_at > now
+    }
+    urls = [i["InstallerUrl"] for i in installers if i.get("Architecture") == arch]
+    if any(url in missing for url in urls):
+        return False
+    results = probe.run({url: partial(_is_available, url) for url in urls})
+    missing.update({url: now + MISSING_TTL for url, ok in results.items() if not ok})
+    local_cache.store(_MISSING_CACHE, missing)
+    return all(results.values())
 
 
 def _get_update_args(github_release: dict | None, old_version: str):
     if github_release:
         args: UpdateArgs = {
             "base_version": old_version,
-            "owner_and_repo": "telegramdesktop/tdesktop",
+            "owner_and_repo": _OWNER_AND_REPO,
             "release_notes": {"en-US": (github_release["body"], github_release["html_url"])},
         }
     else:
@@ -100,6 +119,12 @@ def _get_update_args(github_release: dict | None, old_version: str):
 
 
 class Telegram(WithReleaseNotes):
+    HOOKS: ClassVar[dict[str, Hook]] = {
+        "has_release_notes": Hook(cost=2),
+        # HEAD probes on the arm64 installers until they are known to exist
+        "get_memo": Hook(cost=3, fresh_for=FRESH_FOR_ONE_RUN),
+    }
+
     @override
     def __init__(self) -> None:
         super().__init__(__name__, "Telegram.TelegramDesktop")
@@ -110,10 +135,14 @@ class Telegram(WithReleaseNotes):
         v, self.is_arm_updated = get_latest_version()
         return v
 
+    @cached_property
+    def github_release(self) -> dict | None:
+        # get_memo may run without has_release_notes
+        return _get_github_release(self.version)
+
     @override
     def has_release_notes(self) -> bool:
-        self.github_release = (github_release := _get_github_release(self.version))
-        return github_release is not None
+        return self.github_release is not None
 
     @override
     def get_installers(self) -> list[Installer]:
@@ -145,14 +174,17 @@ class Telegram(WithReleaseNotes):
         }
 
 
-def get_latest_version() -> tuple[Version, bool]:
-    response = json.loads(get("https://td.telegram.org/current4"))
+def _get_stable(channel: str):
+    url = "https://td.telegram.org/current4"
+    return probe.cached(url, lambda: json.loads(get(url)))[channel]["stable"]
 
-    win64_stable = response["win64"]["stable"]
-    win32_stable = response["win"]["stable"]
 
-    assert (version_code := win64_stable["released"]) == win32_stable["released"]
-    is_arm_updated = version_code == response["winarm"]["stable"]
+def get_latest_version() -> tuple[Version, bool]:
+    stable = probe.run({channel: partial(_get_stable, channel) for channel in _CHANNELS})
+    version_code = probe.agree({
+        channel: stable[channel]["released"] for channel in ("win64", "win")
+    })
+    is_arm_updated = version_code == stable["winarm"]
 
     major_minor, patch = divmod(int(version_code), 1_000)
     major, minor = divmod(major_minor, 1_000)
@@ -161,14 +193,14 @@ def get_latest_version() -> tuple[Version, bool]:
 
 
 def _get_github_release(latest_version: str) -> dict | None:
-    releases = get_gh_api("https://api.github.com/repos/telegramdesktop/tdesktop/releases")
     tag_name = f"v{latest_version}"
-    try:
-        index = next(i for i, r in enumerate(releases) if r["tag_name"] == tag_name)
-    except StopIteration:
+    if not (release := get_release_by_tag(_OWNER_AND_REPO, tag_name)):
         return None
-    for i in range(index):
-        if releases[i]["prerelease"]:
+    # only the releases listed before the tag are read
+    for newer in iter_releases(_OWNER_AND_REPO):
+        if newer["tag_name"] == tag_name:
+            return release
+        if newer["prerelease"]:
             continue
-        assert all("Windows" not in asset["label"] for asset in releases[i]["assets"])
-    return releases[index]
+        assert all("Windows" not in asset["label"] for asset in newer["assets"])
+    return None
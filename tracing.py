@@ -0,0 +1,56 @@
+import json
+import os
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter_ns
+
+from metrics import REPORTS_DIR
+
+_PID = os.getpid()
+_EPOCH = perf_counter_ns()
+
+_events: list[dict] = []
+_thread_names: dict[int, str] = {}
+
+
+@contextmanager
+def span(name: str, **args: object) -> Iterator[None]:
+    started = perf_counter_ns()
+    try:
+        yield
+    finally:
+        ended = perf_counter_ns()
+        tid = threading.get_native_id()
+        _thread_names.setdefault(tid, threading.current_thread().name)
+        _events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (started - _EPOCH) / 1000,
+            "dur": (ended - started) / 1000,
+            "pid": _PID,
+            "tid": tid,
+            "args": {key: str(value) for key, value in args.items()},
+        })
+
+
+def traced[**P, R](fn: Callable[P, R]) -> Callable[P, R]:
+    name = f"{fn.__module__}.{fn.__qualname__}"
+
+    @wraps(fn)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        with span(name):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def write_trace() -> None:
+    metadata = [
+        {"name": "thread_name", "ph": "M", "pid": _PID, "tid": tid, "args": {"name": name}}
+        for tid, name in _thread_names.items()
+    ]
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    with open(f"{REPORTS_DIR}/trace.json", "w") as f:
+        json.dump({"traceEvents": metadata + _events, "displayTimeUnit": "ms"}, f)
@@ -1,22 +1,20 @@
-import re
-
 import github_releases
+from release_notes import Rules
 
+OWNER_AND_REPO = "2dust/v2rayN"
 
-def _transform(release_notes: str) -> str:
-    release_notes = re.sub(r"^#+ 本次更新.*", "", release_notes)
-    release_notes = re.sub(r"#+ 注意.+", "", release_notes, flags=re.DOTALL)
-    release_notes = re.sub(r"#+ 发布文件介绍.*", "", release_notes, flags=re.DOTALL)
-    return release_notes
+_RULES = Rules(title="本次更新", footers=("注意", "发布文件介绍"))
 
 
-def main():
+def main(release: dict | None = None):
     github_releases.main(
         identifier="2dust.v2rayN",
         installers=[{"Architecture": "x64", "InstallerUrl": "v2rayN-windows-64-With-Core.zip"}],
         locale="zh-CN",
         moniker=__name__,
-        owner_and_repo="2dust/v2rayN",
+        owner_and_repo=OWNER_AND_REPO,
         pre_release=True,
-        transform_release_notes=_transform,
+        catch_up=True,
+        release=release,
+        transform_release_notes=_RULES,
     )
@@ -0,0 +1,146 @@
+import hashlib
+import hmac
+import json
+from argparse import ArgumentParser
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import getenv
+from queue import Queue
+from threading import Lock, Thread
+from traceback import print_exception
+
+from types import ModuleType
+
+import main as scheduler
+
+# the packages the scheduler runs that are GitHub releases, so both entry points run the same set
+REPOSITORIES = {
+    mod.OWNER_AND_REPO.lower(): mod for mod in scheduler.PACKAGES if hasattr(mod, "OWNER_AND_REPO")
+}
+
+LOCK = Lock()  # serializes package runs, shared with main.py's daemon cycles
+
+type Dispatch = Callable[[ModuleType, dict], None]
+
+
+def sign(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def make_server(address: tuple[str, int], secret: str, dispatch: Dispatch) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            signature = self.headers.get("X-Hub-Signature-256", "")
+            if not hmac.compare_digest(sign(secret, body), signature):
+                return self._reply(401, "Bad signature")
+
+            if (event := self.headers.get("X-GitHub-Event")) == "ping":
+                return self._reply(200, "pong")
+            if event != "release":
+                return self._reply(204)
+
+            payload = json.loads(body)
+            # "released" repeats it for full releases and never comes for pre-releases
+            if payload["action"] != "published":
+                return self._reply(204)
+            if not (mod := REPOSITORIES.get(payload["repository"]["full_name"].lower())):
+                return self._reply(404, "Unknown repository")
+
+            dispatch(mod, payload["release"])
+            self._reply(202, "Accepted")
+
+        def _reply(self, status: int, text: str = ""):
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(data := text.encode())))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return ThreadingHTTPServer(address, Handler)
+
+
+def start_worker(after: Callable[[], None] | None = None) -> Dispatch:
+    jobs: Queue[tuple[ModuleType, dict]] = Queue()
+
+    def work():
+        import github
+        import metrics
+        import probe
+        import profiling
+        import tracing
+
+        while True:
+            mod, release = jobs.get()
+            print(f"Webhook: {release['html_url']}", flush=True)
+            with LOCK:
+                try:
+                    probe.clear()
+                    github.check_repo_and_delete_merged_branches()
+                    # the same per-package context as main.run, so journal entries resume
+                    name = mod.__name__
+                    with metrics.package(name), tracing.span(name), profiling.package(name):
+                        github.resume_pending(name)
+                        mod.main(release)
+                except Exception as e:
+                    print_exception(e)
+                if after is not None:
+                    try:
+                        after()
+                    except Exception as e:
+                        print_exception(e)
+
+    Thread(target=work, name="webhook-worker", daemon=True).start()
+    return lambda mod, release: jobs.put((mod, release))
+
+
+def serve(host: str, port: int, after: Callable[[], None] | None = None):
+    # after runs once each job is done, e.g. to push the state files like a timer cycle
+    assert (secret := getenv("WEBHOOK_SECRET"))
+    server = make_server((host, port), secret, start_worker(after))
+    print(f"Listening on http://{host}:{server.server_port}", flush=True)
+    return server
+
+
+def post(url: str, path: str, event: str):
+    from common import CLIENT
+
+    assert (secret := getenv("WEBHOOK_SECRET"))
+    with open(path, "rb") as f:
+        body = f.read()
+    headers = {
+        "Content-Type": "application/json",
+        "X-GitHub-Event": event,
+        "X-Hub-Signature-256": sign(secret, body),
+    }
+    response = CLIENT.post(url, content=body, headers=headers)
+    print(response.status_code, response.text)
+
+
+def main():
+    parser = ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="receive GitHub release webhooks")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument(
+        "--push", action="store_true", help="commit and push state after jobs"
+    )
+    post_parser = commands.add_parser("post", help="post a recorded payload to a receiver")
+    post_parser.add_argument("url")
+    post_parser.add_argument("payload")
+    post_parser.add_argument("--event", default="release")
+    args = parser.parse_args()
+
+    if args.command == "post":
+        return post(args.url, args.payload, args.event)
+
+    import rich
+
+    rich.reconfigure(force_terminal=True, width=4096)
+    after = scheduler.push_state if args.push else None
+    with serve(args.host, args.port, after) as server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,24 @@
 import json
+import re
 import xml.etree.ElementTree as ET
+from collections.abc import Iterable, Iterator
 from datetime import datetime
-from typing import override
+from itertools import chain
+from typing import ClassVar, override
 from zoneinfo import ZoneInfo
 
-from common import CLIENT, VERSION_REGEX, UpdateArgs, Version, get
+import local_cache
+import metrics
+from common import CLIENT, VERSION_REGEX, UpdateArgs, Version, get, iter_json_array
 from manifest import Installer
-from with_release_notes import WithReleaseNotes
+from with_release_notes import FRESH_FOR_ONE_RUN, Hook, WithReleaseNotes
+
+
+_CHANGELOG_URL = "https://z.weixin.qq.com/web/change-log/"
+_CHANGELOG_CACHE = "wetype-change-log"
+_CHANGELOG_REGEX = re.compile(r'window\.injectData=.*?"appChangelog"\s*:', re.DOTALL)
+# request header to send for each response validator
+_VALIDATORS = {"ETag": "If-None-Match", "Last-Modified": "If-Modified-Since"}
 
 
 def main():
@@ -21,17 +33,44 @@ def _get_latest_version():
     return new_version, url
 
 
-def _get_release(new_version: str) -> dict | None:
-    changelog_html = get("https://z.weixin.qq.com/web/change-log/")
-    start = changelog_html.index(pre := "window.injectData=") + len(pre)
-    end = changelog_html.index("</script>", start)
-    changelog: list = json.loads(changelog_html[start:end])["appChangelog"]
+def _iter_changelog(chunks: Iterable[str]) -> Iterator[dict]:
+    chunks = iter(chunks)
+    html = ""
+    for chunk in chunks:
+        html += chunk
+        if match := _CHANGELOG_REGEX.search(html):
+            yield from iter_json_array(chain([html[match.end() :]], chunks))
+            return
+    raise ValueError("appChangelog not found")
+
 
+def _get_release(new_version: str) -> dict | None:
     short_version = str(new_version).rpartition(".")[0]
-    try:
-        release = next(r for r in changelog if r["platform"] == 4 and r["version"] == short_version)
-    except StopIteration:
-        release = None
+    # the page only changes when a release is added, so waiting for one costs a 304
+    cached = local_cache.load(_CHANGELOG_CACHE)
+    headers = cached["headers"] if cached and cached["version"] == short_version else {}
+    with CLIENT.stream("GET", _CHANGELOG_URL, headers=headers) as response:
+        if response.status_code == 304:
+            assert cached
+            return cached["release"]
+        assert response.is_success, response.status_code
+        release = next(
+            (
+                r
+                for r in _iter_changelog(response.iter_text())
+                if r["platform"] == 4 and r["version"] == short_version
+            ),
+            None,
+        )
+        metrics.on_body(response)
+    headers = {
+        header: value
+        for validator, header in _VALIDATORS.items()
+        if (value := response.headers.get(validator))
+    }
+    local_cache.store(
+        _CHANGELOG_CACHE, {"version": short_version, "headers": headers, "release": release}
+    )
     return release
 
 
@@ -42,7 +81,7 @@ def _get_update_args(release: dict | None, old_version: str):
             "keep_notes_on_version_prefix": old_version.rpartition(".")[0] + ".",
         }
     else:
-        # release_date = datetime.fromtimestamp(release["release_date"], ZoneInfo("Asia/Shanghai"))
+        release_date = datetime.fromtimestamp(release["release_date"], ZoneInfo("Asia/Shanghai"))
 
         release_notes = "\n".join(
             text
@@ -58,11 +97,19 @@ def _get_update_args(release: dict | None, old_version: str):
             },
             # "release_date": release_date.date(),
             "is_url_important": True,
+            "published_at": release_date.isoformat(),
         }
     return args
 
 
 class WeType(WithReleaseNotes):
+    HOOKS: ClassVar[dict[str, Hook]] = {
+        # the change log page, usually answered with a 304
+        "has_release_notes": Hook(cost=2, fresh_for=FRESH_FOR_ONE_RUN),
+        # a HEAD on the installer, whose ETag changes when it is rebuilt in place
+        "get_memo": Hook(cost=1, fresh_for=FRESH_FOR_ONE_RUN),
+    }
+
     def __init__(self) -> None:
         super().__init__(__name__, "Tencent.WeType")
 
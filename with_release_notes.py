@@ -1,12 +1,19 @@
 import json
 from abc import ABC, abstractmethod
-from typing import TypedDict, final
+from collections.abc import Callable
+from dataclasses import dataclass
+from time import time
+from typing import ClassVar, TypedDict, final
 
 from rich import print
 
+import journal
+import local_cache
+import state
 from common import UpdateArgs, Version
 from github import PRNumber, update
 from manifest import Installer
+from tracing import span
 
 
 class _VersionData(TypedDict):
@@ -16,7 +23,23 @@ class _VersionData(TypedDict):
     memo: object
 
 
+RUN_INTERVAL = 60 * 60
+# the scheduled run after a check reuses its result and the one after that checks again, even when
+# GitHub delays runs by different amounts of up to half an hour, so news is at most one run late
+FRESH_FOR_ONE_RUN = RUN_INTERVAL * 3 // 2
+
+
+@dataclass(frozen=True)
+class Hook:
+    # relative cost of one call, cheaper hooks run first
+    cost: float = 1
+    # seconds an inconclusive result stays valid while the version is unchanged
+    fresh_for: float = 0
+
+
 class WithReleaseNotes(ABC):
+    HOOKS: ClassVar[dict[str, Hook]] = {"has_release_notes": Hook(), "get_memo": Hook()}
+
     version: str
     old_version: str
 
@@ -26,48 +49,83 @@ class WithReleaseNotes(ABC):
 
     @final
     def main(self):
-        with open(storage := f"{self.moniker}.json") as f:
-            old_version_data: _VersionData = json.load(f)
+        old_state = state.read(storage := f"{self.moniker}.json")
+        old_version_data: _VersionData = json.loads(old_state)
 
         if old_blocking_pr := old_version_data["blocking_pr"]:
             print(f"[bold red]{self.moniker}: Last update was blocked by PR #{old_blocking_pr}[/]")
 
         self.old_version = old_version_data["version"]
         old_version = Version(self.old_version)
-        if (latest_version := self.get_latest_version()) < old_version:
+        with span("get_latest_version"):
+            latest_version = self.get_latest_version()
+        if latest_version < old_version:
             return print(
                 f"::error file={self.moniker}.py,title=Version"
                 f" rollback::{self.moniker} {old_version} -> {latest_version}"
             )
 
         self.version = (version := f"{latest_version}")
-        has_release_notes = self.has_release_notes()
-        memo = self.get_memo(old_version_data["memo"] if old_version == latest_version else None)
-        should_force_rerun = old_version == latest_version and old_version_data["memo"] != memo
-
-        if old_version == latest_version:
-            has_minor_update = False
-            if not old_version_data["has_release_notes"] and has_release_notes:
-                has_minor_update = True
-            elif should_force_rerun:
-                has_minor_update = True
-            elif old_blocking_pr:
-                has_minor_update = True
-            if not has_minor_update:
+        is_same_version = old_version == latest_version
+        old_memo = old_version_data["memo"] if is_same_version else None
+        results: dict[str, object] = {}
+        hooks: dict[str, Callable[[], object]] = {
+            "has_release_notes": self.has_release_notes,
+            "get_memo": lambda: self.get_memo(old_memo),
+        }
+        order = sorted(hooks, key=lambda name: self.HOOKS[name].cost)
+
+        def is_conclusive(name: str) -> bool:
+            # whether the result alone proves there is something to update
+            if name == "has_release_notes":
+                return bool(results[name]) and not old_version_data["has_release_notes"]
+            return results[name] != old_memo
+
+        def evaluate(name: str) -> None:
+            with span(name):
+                results[name] = hooks.pop(name)()
+
+        now = time()
+        if is_same_version and not old_blocking_pr:
+            cached = local_cache.load(self.moniker)
+            checked = cached["checked"] if cached and cached["version"] == version else {}
+            for name in order:
+                if name == "has_release_notes" and old_version_data["has_release_notes"]:
+                    continue  # notes that were already found cannot make an update
+                if now - checked.get(name, 0) < self.HOOKS[name].fresh_for:
+                    continue
+                evaluate(name)
+                checked[name] = now
+                if is_conclusive(name):
+                    break
+            else:
+                local_cache.store(self.moniker, {"version": version, "checked": checked})
                 return
 
+        for name in order:
+            if name in hooks:
+                evaluate(name)
+        has_release_notes = bool(results["has_release_notes"])
+        memo = results["get_memo"]
+        should_force_rerun = is_same_version and old_version_data["memo"] != memo
+
         args = self.get_update_args()
         args["should_force_rerun"] = should_force_rerun
-        blocking_pr = update(self.identifier, version, self.get_installers(), args)
-
-        with open(storage, "w") as f:
-            new_version_data: _VersionData = {
-                "version": version,
-                "has_release_notes": has_release_notes,
-                "blocking_pr": blocking_pr,
-                "memo": memo,
-            }
-            json.dump(new_version_data, f, separators=(",", ":"))
+        with span("get_installers"):
+            installers = self.get_installers()
+        blocking_pr = update(self.identifier, version, installers, args)
+
+        new_version_data: _VersionData = {
+            "version": version,
+            "has_release_notes": has_release_notes,
+            "blocking_pr": blocking_pr,
+            "memo": memo,
+        }
+        state.write(
+            storage, json.dumps(new_version_data, separators=(",", ":")), expected=old_state
+        )
+        local_cache.store(self.moniker, {"version": version, "checked": dict.fromkeys(order, now)})
+        journal.discard(self.identifier)
 
     @abstractmethod
     def get_latest_version(self) -> Version: ...